@@ -1,104 +1,128 @@
 # app.py
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, WebSocket
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.logger import logger as fastapi_logger
 from dotenv import load_dotenv
 import os
-import requests
-import io
+import asyncio
+import httpx
+import contextlib
 import base64
-from pydub import AudioSegment
 import logging
 import json
-from typing import Optional
+import time
+from typing import List, Optional
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from audio_pool import AudioWorkerPool, PoolSaturatedError
+from audio_processing import (
+    TARGET_RATE, AudioProcessingError, normalize_audio, parse_wav_header, passthrough_info, wav_to_float,
 )
-logger = logging.getLogger(__name__)
+from audio_stream import AudioFieldExtractor, iter_upload, normalized_pcm_stream, ultravox_request_body
+from batch_jobs import FetchPolicy, JobManager
+from batching import BatchScheduler
+from conversation import ConversationSession
+from metrics import MetricsMiddleware, StageTimer, record_stage, render as render_metrics, timed_stage, track_busy, track_queue
+from reply_cache import ReplyCache
+from static_assets import AssetIndex, StaticAssetsApp
+from ultravox_client import UltraVoxClient, redact_error_body, redact_payload
+from upstream_codec import (
+    CODEC_CHOICES, TRANSPORTS, choose_codec, encode_for_upstream, json_payload, multipart_request, needs_encoder,
+    wav_duration_s,
+)
+from vad import split_segments, stitch_transcripts
+from whisper_registry import registry as whisper_registry
 
 # Load environment variables
 load_dotenv(override=True)
 
+# Configure logging; DEBUG logs every request's audio details and upstream traffic
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
 # Environment variables
 ULTRAVOX_API_KEY = os.getenv("ULTRAVOX_API_KEY")
 ULTRAVOX_URL = os.getenv("ULTRAVOX_URL")
 DEFAULT_PROMPT = os.getenv("DEFAULT_PROMPT", "For like Michigan")
 ULTRAVOX_MODEL = os.getenv("ULTRAVOX_MODEL", "ultravox-1")
 
-async def call_ultravox_api(audio_base64: str) -> tuple[bytes, dict]:
-    """
-    Call UltraVox API with the processed audio
-    Returns: (response_audio_bytes, response_info)
-    """
-    try:
-        # Structure payload according to API requirements
-        payload = {
-            "model": ULTRAVOX_MODEL,  # Add the model field
-            "messages": [
-                {
-                    "role": "system",
-                    "content": f"content: {DEFAULT_PROMPT}\naudio_data: {audio_base64}"
-                }
-            ]
-        }
-
-        headers = {
-            "Authorization": f"Api-Key {ULTRAVOX_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        logger.debug(f"Sending request to UltraVox API with payload keys: {list(payload.keys())}")
-        
-        response = requests.post(
-            ULTRAVOX_URL,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-
-        if response.status_code != 200:
-            error_detail = None
-            try:
-                error_detail = response.json()
-                logger.error(f"UltraVox API error detail: {error_detail}")
-            except:
-                error_detail = response.text
-                logger.error(f"UltraVox API error text: {error_detail}")
-
-            if response.status_code == 400:
-                # Log additional debugging info
-                logger.error(f"Request payload structure: {payload}")
-                
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"UltraVox API error: {error_detail}"
-            )
-
-        response_data = response.json()
-        
-        # Extract audio response carefully
-        if not isinstance(response_data, dict):
-            raise ValueError(f"Unexpected response format: {type(response_data)}")
-            
-        response_audio = response_data.get("audio")
-        if not response_audio:
-            raise ValueError("No audio in UltraVox response")
-
-        return base64.b64decode(response_audio), response_data
-
-    except requests.RequestException as e:
-        logger.error(f"Request error to UltraVox API: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=503, detail=f"UltraVox API connection error: {str(e)}")
+# Upstream client tuning
+ULTRAVOX_TIMEOUT = float(os.getenv("ULTRAVOX_TIMEOUT", 30))
+ULTRAVOX_MAX_CONNECTIONS = int(os.getenv("ULTRAVOX_MAX_CONNECTIONS", 100))
+ULTRAVOX_MAX_KEEPALIVE = int(os.getenv("ULTRAVOX_MAX_KEEPALIVE", 20))
+ULTRAVOX_MAX_CONCURRENCY = int(os.getenv("ULTRAVOX_MAX_CONCURRENCY", 64))
+ULTRAVOX_MAX_RETRIES = int(os.getenv("ULTRAVOX_MAX_RETRIES", 3))
+
+# Upstream wire format: audio codec (auto|wav|flac|opus) and transport (json|multipart).
+# With auto, clips shorter than ULTRAVOX_FLAC_MIN_S go as WAV, shorter than
+# ULTRAVOX_OPUS_MIN_S as FLAC, and longer ones as Opus.
+ULTRAVOX_AUDIO_CODEC = os.getenv("ULTRAVOX_AUDIO_CODEC", "wav")
+ULTRAVOX_TRANSPORT = os.getenv("ULTRAVOX_TRANSPORT", "json")
+ULTRAVOX_FLAC_MIN_S = float(os.getenv("ULTRAVOX_FLAC_MIN_S", 1))
+ULTRAVOX_OPUS_MIN_S = float(os.getenv("ULTRAVOX_OPUS_MIN_S", 20))
+ULTRAVOX_OPUS_BITRATE = os.getenv("ULTRAVOX_OPUS_BITRATE", "32k")
+
+# Audio decoding worker pool
+AUDIO_POOL_KIND = os.getenv("AUDIO_POOL_KIND", "process")
+AUDIO_POOL_WORKERS = int(os.getenv("AUDIO_POOL_WORKERS", 0)) or None
+AUDIO_POOL_QUEUE = int(os.getenv("AUDIO_POOL_QUEUE", 32))
+AUDIO_POOL_RETRY_AFTER = int(os.getenv("AUDIO_POOL_RETRY_AFTER", 1))
+
+# Voice activity detection
+VAD_TRIM_SILENCE = os.getenv("VAD_TRIM_SILENCE", "true").lower() in ("1", "true", "yes")
+VAD_MAX_SEGMENT_S = float(os.getenv("VAD_MAX_SEGMENT_S", 30))
+VAD_SEGMENT_OVERLAP_S = float(os.getenv("VAD_SEGMENT_OVERLAP_S", 1))
+
+# Reply cache
+REPLY_CACHE_MAX_BYTES = int(os.getenv("REPLY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+REPLY_CACHE_TTL = float(os.getenv("REPLY_CACHE_TTL", 3600))
+REPLY_CACHE_DIR = os.getenv("REPLY_CACHE_DIR")
+
+# Local Whisper transcription
+WHISPER_MODEL_ID = os.getenv("WHISPER_MODEL_ID", "openai/whisper-large-v3")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE")
+WHISPER_DTYPE = os.getenv("WHISPER_DTYPE")
+WHISPER_WARMUP = os.getenv("WHISPER_WARMUP", "false").lower() in ("1", "true", "yes")
+WHISPER_MAX_BATCH_SIZE = int(os.getenv("WHISPER_MAX_BATCH_SIZE", 8))
+WHISPER_MAX_WAIT_MS = float(os.getenv("WHISPER_MAX_WAIT_MS", 20))
+
+# Batch jobs: directory for job state and results, and items processed concurrently per job
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", 0)) or ULTRAVOX_MAX_CONCURRENCY
+# URL items: size limit, and hosts to restrict fetching to (otherwise any public host)
+JOBS_MAX_DOWNLOAD_BYTES = int(os.getenv("JOBS_MAX_DOWNLOAD_BYTES", 100 * 1024 * 1024))
+JOBS_ALLOWED_HOSTS = tuple(h.strip().lower() for h in os.getenv("JOBS_ALLOWED_HOSTS", "").split(",") if h.strip())
+
+# Static front end, served with precompression and caching when FRONTEND_DIR is set
+FRONTEND_DIR = os.getenv("FRONTEND_DIR")
+FRONTEND_PATH = os.getenv("FRONTEND_PATH", "/app")
+FRONTEND_CACHE_DIR = os.getenv("FRONTEND_CACHE_DIR")
+
+# Shared upstream client, audio pool, reply cache and ASR batcher, created at startup
+ultravox_client: Optional[UltraVoxClient] = None
+audio_pool: Optional[AudioWorkerPool] = None
+reply_cache: Optional[ReplyCache] = None
+asr_batcher: Optional[BatchScheduler] = None
+job_manager: Optional[JobManager] = None
 
 # Validate required environment variables
 if not ULTRAVOX_API_KEY:
     raise ValueError("ULTRAVOX_API_KEY environment variable is required")
 if not ULTRAVOX_URL:
     raise ValueError("ULTRAVOX_URL environment variable is required")
+if ULTRAVOX_AUDIO_CODEC not in CODEC_CHOICES:
+    raise ValueError(f"ULTRAVOX_AUDIO_CODEC must be one of {CODEC_CHOICES}")
+if ULTRAVOX_TRANSPORT not in TRANSPORTS:
+    raise ValueError(f"ULTRAVOX_TRANSPORT must be one of {TRANSPORTS}")
+if ULTRAVOX_MAX_CONCURRENCY < 1:
+    raise ValueError("ULTRAVOX_MAX_CONCURRENCY must be at least 1")
+if JOBS_CONCURRENCY < 1:
+    raise ValueError("JOBS_CONCURRENCY must be at least 1 (or 0 for ULTRAVOX_MAX_CONCURRENCY)")
+if not 0 <= VAD_SEGMENT_OVERLAP_S < VAD_MAX_SEGMENT_S:
+    raise ValueError("VAD_SEGMENT_OVERLAP_S must be at least 0 and less than VAD_MAX_SEGMENT_S")
 
 app = FastAPI(
     title="UltraVox Audio Service",
@@ -106,6 +130,8 @@ app = FastAPI(
     version="1.0.0"
 )
 
+app.add_middleware(MetricsMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -119,84 +145,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class AudioProcessingError(Exception):
-    """Custom exception for audio processing errors"""
-    pass
-
 async def process_audio_file(file_bytes: bytes, content_type: str) -> tuple[bytes, dict]:
     """
-    Process uploaded audio file and convert to required format
+    Process uploaded audio file and convert to required format.
+    Decoding runs in the bounded audio worker pool to keep the event loop free.
     Returns: (processed_audio_bytes, audio_info)
     """
-    try:
-        # Load audio file using pydub
-        audio = AudioSegment.from_file(io.BytesIO(file_bytes), format="webm")
-        
-        # Log audio properties
-        audio_info = {
-            "channels": audio.channels,
-            "sample_width": audio.sample_width,
-            "frame_rate": audio.frame_rate,
-            "duration_ms": len(audio)
-        }
-        logger.info(f"Audio properties: {audio_info}")
-
-        # Convert to required format (16kHz mono WAV)
-        audio = audio.set_channels(1)
-        audio = audio.set_frame_rate(16000)
-        
-        # Export to WAV
-        buffer = io.BytesIO()
-        audio.export(buffer, format="wav", parameters=[
-            "-acodec", "pcm_s16le",
-            "-ac", "1",
-            "-ar", "16000"
-        ])
-        buffer.seek(0)
-        return buffer.read(), audio_info
-
-    except Exception as e:
-        logger.error(f"Error processing audio: {str(e)}", exc_info=True)
-        raise AudioProcessingError(f"Failed to process audio: {str(e)}")
-
-
-async def call_ultravox_api(audio_base64: str) -> tuple[bytes, dict]:
+    if not VAD_TRIM_SILENCE:
+        # Already-normalized WAV is answered from its header, without shipping it to a worker and back
+        audio_info = passthrough_info(file_bytes, content_type)
+        if audio_info is not None:
+            record_stage("decode", audio_info["timings_ms"]["decode"] / 1000)
+            return file_bytes, audio_info
+
+    started = time.perf_counter()
+    processed_audio, audio_info = await audio_pool.run(normalize_audio, file_bytes, content_type, VAD_TRIM_SILENCE)
+
+    # Stages timed inside the worker; the rest is queueing and transfer to and from it
+    worker_seconds = 0.0
+    for stage, ms in audio_info.get("timings_ms", {}).items():
+        record_stage(stage, ms / 1000)
+        worker_seconds += ms / 1000
+    record_stage("pool_wait", max(0.0, time.perf_counter() - started - worker_seconds))
+    return processed_audio, audio_info
+
+
+async def call_ultravox_api(processed_audio: bytes) -> tuple[bytes, dict]:
     """
-    Call UltraVox API with the processed audio
+    Call UltraVox API with the processed audio, encoded and sent according
+    to ULTRAVOX_AUDIO_CODEC and ULTRAVOX_TRANSPORT
     Returns: (response_audio_bytes, response_info)
     """
     try:
-        # Structure payload according to API requirements
-        payload = {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": f"content: {DEFAULT_PROMPT}\naudio_data: {audio_base64}"
-                }
-            ]
-        }
-
-        headers = {
-            "Authorization": f"Api-Key {ULTRAVOX_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        logger.debug(f"Sending request to UltraVox API with payload structure: {payload.keys()}")
-        
-        response = requests.post(
-            ULTRAVOX_URL,
-            headers=headers,
-            json=payload,
-            timeout=30
+        with timed_stage("encode"):
+            codec = choose_codec(
+                ULTRAVOX_AUDIO_CODEC, wav_duration_s(processed_audio), ULTRAVOX_FLAC_MIN_S, ULTRAVOX_OPUS_MIN_S,
+            )
+            if needs_encoder(codec):
+                audio = await audio_pool.run(
+                    encode_for_upstream, processed_audio, codec,
+                    ULTRAVOX_FLAC_MIN_S, ULTRAVOX_OPUS_MIN_S, ULTRAVOX_OPUS_BITRATE,
+                )
+            else:
+                # WAV passes through; not worth a round trip to a worker and a pool slot
+                audio = encode_for_upstream(processed_audio, codec)
+        logger.debug(
+            f"Sending {audio.duration_s}s of audio to UltraVox as {audio.codec} over {ULTRAVOX_TRANSPORT} "
+            f"({len(audio.data)} bytes, encoded in {audio.encode_ms}ms)"
         )
 
+        if ULTRAVOX_TRANSPORT == "multipart":
+            with timed_stage("upstream"):
+                response = await ultravox_client.post_multipart(
+                    **multipart_request(audio, DEFAULT_PROMPT, ULTRAVOX_MODEL)
+                )
+        else:
+            with timed_stage("base64"):
+                payload = await asyncio.to_thread(json_payload, audio, DEFAULT_PROMPT, ULTRAVOX_MODEL)
+            with timed_stage("upstream"):
+                response = await ultravox_client.post_json(payload)
+
         if response.status_code != 200:
             error_detail = None
+            # Upstream errors may echo the request, base64 audio included
             try:
-                error_detail = response.json()
+                error_detail = redact_payload(response.json())
                 logger.error(f"UltraVox API error detail: {error_detail}")
             except:
-                error_detail = response.text
+                error_detail = redact_payload(response.text)
                 logger.error(f"UltraVox API error text: {error_detail}")
 
             raise HTTPException(
@@ -204,22 +220,116 @@ async def call_ultravox_api(audio_base64: str) -> tuple[bytes, dict]:
                 detail=f"UltraVox API error: {error_detail}"
             )
 
-        response_data = response.json()
-        
-        # Extract audio response carefully
-        if not isinstance(response_data, dict):
-            raise ValueError(f"Unexpected response format: {type(response_data)}")
-            
-        response_audio = response_data.get("audio")
-        if not response_audio:
-            raise ValueError("No audio in UltraVox response")
+        with timed_stage("reply_decode"):
+            response_data = response.json()
+
+            # Extract audio response carefully
+            if not isinstance(response_data, dict):
+                raise ValueError(f"Unexpected response format: {type(response_data)}")
 
-        return base64.b64decode(response_audio), response_data
+            response_audio = response_data.get("audio")
+            if not response_audio:
+                raise ValueError("No audio in UltraVox response")
 
-    except requests.RequestException as e:
+            return base64.b64decode(response_audio), response_data
+
+    except httpx.HTTPError as e:
         logger.error(f"Request error to UltraVox API: {str(e)}", exc_info=True)
         raise HTTPException(status_code=503, detail=f"UltraVox API connection error: {str(e)}")
-    
+
+async def cached_ultravox_reply(processed_audio: bytes) -> tuple[bytes, dict]:
+    """
+    Get the UltraVox reply for normalized WAV audio through the reply cache.
+    Returns: (response_audio_bytes, response_info)
+    """
+    wav = parse_wav_header(processed_audio)
+    pcm = memoryview(processed_audio)[wav.data_offset:wav.data_offset + wav.data_size]
+    with timed_stage("cache_key"):
+        cache_key = await asyncio.to_thread(ReplyCache.make_key, pcm, DEFAULT_PROMPT, ULTRAVOX_MODEL)
+
+    async def fetch() -> tuple[bytes, dict]:
+        response_audio, response_info = await call_ultravox_api(processed_audio)
+        # The audio is stored separately; keep the base64 copy out of the cache
+        return response_audio, {k: v for k, v in response_info.items() if k != "audio"}
+
+    return await reply_cache.get_or_compute(cache_key, fetch)
+
+def transcribe_batch(clips: list) -> list:
+    """Run several 16kHz clips through the local Whisper pipeline in one batched pass"""
+    pipe = whisper_registry.get(WHISPER_MODEL_ID, WHISPER_DEVICE, WHISPER_DTYPE)
+    inputs = [{"raw": clip, "sampling_rate": TARGET_RATE} for clip in clips]
+    return pipe(inputs, batch_size=len(inputs))
+
+@app.on_event("startup")
+async def startup():
+    """Create the shared UltraVox client, audio worker pool, reply cache and ASR batcher"""
+    global ultravox_client, audio_pool, reply_cache, asr_batcher
+    ultravox_client = UltraVoxClient(
+        ULTRAVOX_URL,
+        ULTRAVOX_API_KEY,
+        timeout=ULTRAVOX_TIMEOUT,
+        max_connections=ULTRAVOX_MAX_CONNECTIONS,
+        max_keepalive_connections=ULTRAVOX_MAX_KEEPALIVE,
+        max_concurrency=ULTRAVOX_MAX_CONCURRENCY,
+        max_retries=ULTRAVOX_MAX_RETRIES,
+    )
+    audio_pool = AudioWorkerPool(
+        kind=AUDIO_POOL_KIND,
+        max_workers=AUDIO_POOL_WORKERS,
+        max_queue=AUDIO_POOL_QUEUE,
+        retry_after=AUDIO_POOL_RETRY_AFTER,
+    )
+    reply_cache = ReplyCache(
+        max_bytes=REPLY_CACHE_MAX_BYTES,
+        ttl=REPLY_CACHE_TTL,
+        disk_dir=REPLY_CACHE_DIR,
+    )
+    asr_batcher = BatchScheduler(
+        transcribe_batch,
+        max_batch_size=WHISPER_MAX_BATCH_SIZE,
+        max_wait_ms=WHISPER_MAX_WAIT_MS,
+    )
+    asr_batcher.start()
+
+    # Queue depths and in-progress counts, read when /metrics is scraped
+    track_queue("audio_pool", lambda: audio_pool.stats()["queued"])
+    track_busy("audio_pool", lambda: audio_pool.stats()["running"])
+    track_queue("upstream", lambda: ultravox_client.stats()["waiting"])
+    track_busy("upstream", lambda: ultravox_client.stats()["in_flight"])
+    track_queue("asr_batcher", lambda: asr_batcher.stats()["queue_depth"])
+
+    if WHISPER_WARMUP:
+        report = await asyncio.to_thread(whisper_registry.warm_up, WHISPER_MODEL_ID, WHISPER_DEVICE, WHISPER_DTYPE)
+        logger.info(f"Whisper warm-up complete: {report}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close pooled upstream connections and stop audio workers"""
+    if ultravox_client is not None:
+        await ultravox_client.aclose()
+    if audio_pool is not None:
+        audio_pool.shutdown()
+    if asr_batcher is not None:
+        await asr_batcher.stop()
+
+@app.on_event("startup")
+async def start_jobs():
+    """Resume batch jobs left unfinished by the last shutdown (kept apart from startup() for the batch CLI)"""
+    global job_manager
+    job_manager = JobManager(
+        JOBS_DIR, process_audio_file, call_ultravox_api, JOBS_CONCURRENCY,
+        FetchPolicy(max_bytes=JOBS_MAX_DOWNLOAD_BYTES, allowed_hosts=JOBS_ALLOWED_HOSTS),
+    )
+    job_manager.resume()
+    track_queue("jobs", lambda: job_manager.stats()["pending_items"])
+    track_busy("jobs", lambda: job_manager.stats()["in_progress_items"])
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    """Stop running batch jobs; they resume on the next start"""
+    if job_manager is not None:
+        await job_manager.shutdown()
+
 @app.get("/")
 async def health_check():
     """Health check endpoint"""
@@ -229,36 +339,67 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, in-flight requests and queue depths"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    """UltraVox connection pool statistics"""
+    return ultravox_client.stats()
+
+@app.get("/audio_pool/stats")
+async def audio_pool_stats():
+    """Audio worker pool queue statistics"""
+    return audio_pool.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Reply cache hit/miss/eviction counters"""
+    return reply_cache.stats()
+
+@app.get("/whisper/stats")
+async def whisper_stats():
+    """Load time and memory of the warm Whisper models"""
+    return whisper_registry.stats()
+
+@app.get("/whisper/batching/stats")
+async def whisper_batching_stats():
+    """Batch size and queue delay of the local Whisper scheduler"""
+    return asr_batcher.stats()
+
 @app.post("/transcribe_and_reply/")
 async def transcribe_and_reply(file: UploadFile = File(...)):
     """
     Process audio file and get response from UltraVox
     """
+    timer = StageTimer("/transcribe_and_reply/").activate()
     try:
         logger.info(f"Received file: {file.filename}, content_type: {file.content_type}")
         
         # Read uploaded file
-        audio_bytes = await file.read()
-        logger.info(f"Read {len(audio_bytes)} bytes from uploaded file")
+        with timer.stage("read"):
+            audio_bytes = await file.read()
+        logger.debug(f"Read {len(audio_bytes)} bytes from uploaded file")
 
         # Process audio file
         processed_audio, audio_info = await process_audio_file(audio_bytes, file.content_type)
-        logger.info(f"Processed audio size: {len(processed_audio)} bytes")
+        logger.debug(f"Processed audio size: {len(processed_audio)} bytes")
+
+        # Call UltraVox API, or reuse the reply for identical audio
+        response_audio, response_info = await cached_ultravox_reply(processed_audio)
 
-        # Convert to base64
-        audio_base64 = base64.b64encode(processed_audio).decode("utf-8")
-        
-        # Call UltraVox API
-        response_audio, response_info = await call_ultravox_api(audio_base64)
-        
         # Return audio response
-        audio_io = io.BytesIO(response_audio)
-        return FileResponse(
-            audio_io,
-            media_type="audio/wav",
-            filename="response.wav",
-            headers={"Content-Disposition": "attachment; filename=response.wav"}
-        )
+        with timer.stage("response"):
+            response = Response(
+                content=response_audio,
+                media_type="audio/wav",
+                headers={"Content-Disposition": "attachment; filename=response.wav"}
+            )
+        response.headers["Server-Timing"] = timer.server_timing()
+        return response
 
     except AudioProcessingError as e:
         logger.error(str(e))
@@ -266,6 +407,14 @@ async def transcribe_and_reply(file: UploadFile = File(...)):
             content={"error": "Audio processing error", "details": str(e)},
             status_code=400
         )
+
+    except PoolSaturatedError as e:
+        logger.warning(str(e))
+        return JSONResponse(
+            content={"error": "Server busy", "details": str(e)},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
     
     except HTTPException as e:
         # Re-raise FastAPI HTTP exceptions
@@ -278,8 +427,215 @@ async def transcribe_and_reply(file: UploadFile = File(...)):
             status_code=500
         )
 
+    finally:
+        timer.observe()
+
+@app.post("/transcribe_local/")
+async def transcribe_local(response: Response, file: UploadFile = File(...)):
+    """
+    Transcribe audio with the local Whisper model instead of UltraVox
+    """
+    timer = StageTimer("/transcribe_local/").activate()
+    try:
+        logger.info(f"Received file for local transcription: {file.filename}, content_type: {file.content_type}")
+
+        with timer.stage("read"):
+            audio_bytes = await file.read()
+        processed_audio, audio_info = await process_audio_file(audio_bytes, file.content_type)
+        samples = wav_to_float(processed_audio)
+
+        # Transcribe speech segments in parallel; the batcher groups them
+        # with each other and with concurrent requests
+        with timer.stage("segment"):
+            segments = split_segments(samples, TARGET_RATE, VAD_MAX_SEGMENT_S, VAD_SEGMENT_OVERLAP_S)
+        with timer.stage("transcribe"):
+            results = await asyncio.gather(*[
+                asr_batcher.submit(samples[segment.start:segment.end]) for segment in segments
+            ])
+        text = stitch_transcripts(segments, [result["text"] for result in results])
+
+        response.headers["Server-Timing"] = timer.server_timing()
+        return {"text": text, "segments": len(segments), "audio_info": audio_info}
+
+    except AudioProcessingError as e:
+        logger.error(str(e))
+        return JSONResponse(
+            content={"error": "Audio processing error", "details": str(e)},
+            status_code=400
+        )
+
+    except PoolSaturatedError as e:
+        logger.warning(str(e))
+        return JSONResponse(
+            content={"error": "Server busy", "details": str(e)},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    except ImportError as e:
+        logger.error(f"Local transcription unavailable: {str(e)}")
+        return JSONResponse(
+            content={"error": "Local transcription unavailable", "details": str(e)},
+            status_code=503
+        )
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        return JSONResponse(
+            content={"error": "Server error", "details": str(e)},
+            status_code=500
+        )
+
+    finally:
+        timer.observe()
+
+@app.post("/transcribe_and_reply/stream/")
+async def transcribe_and_reply_stream(file: UploadFile = File(...)):
+    """
+    Streaming variant of /transcribe_and_reply/.
+
+    The upload is transcoded, base64-encoded and sent upstream chunk by chunk,
+    and the reply audio is decoded and streamed back as it arrives, so memory
+    use per request stays bounded regardless of recording length.
+    """
+    logger.info(f"Received file for streaming: {file.filename}, content_type: {file.content_type}")
+
+    pcm = normalized_pcm_stream(iter_upload(file), file.content_type)
+    body = ultravox_request_body(pcm, DEFAULT_PROMPT, ULTRAVOX_MODEL)
+
+    stack = contextlib.AsyncExitStack()
+    try:
+        upstream = await stack.enter_async_context(ultravox_client.stream_post(body))
+
+        if upstream.status_code != 200:
+            error_detail = redact_error_body(await upstream.aread())
+            logger.error(f"UltraVox API error text: {error_detail}")
+            raise HTTPException(
+                status_code=upstream.status_code,
+                detail=f"UltraVox API error: {error_detail}"
+            )
+
+        # Read until the first audio bytes so a missing field is still reportable
+        extractor = AudioFieldExtractor()
+        chunks = upstream.aiter_bytes()
+        first = b""
+        async for chunk in chunks:
+            first = extractor.feed(chunk)
+            if first or extractor.done:
+                break
+        if not extractor.found:
+            raise ValueError("No audio in UltraVox response")
+
+    except AudioProcessingError as e:
+        await stack.aclose()
+        logger.error(str(e))
+        return JSONResponse(
+            content={"error": "Audio processing error", "details": str(e)},
+            status_code=400
+        )
+
+    except httpx.HTTPError as e:
+        await stack.aclose()
+        logger.error(f"Request error to UltraVox API: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=503, detail=f"UltraVox API connection error: {str(e)}")
+
+    except HTTPException:
+        await stack.aclose()
+        raise
+
+    except Exception as e:
+        await stack.aclose()
+        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        return JSONResponse(
+            content={"error": "Server error", "details": str(e)},
+            status_code=500
+        )
+
+    async def reply_audio():
+        try:
+            yield first
+            async for chunk in chunks:
+                audio = extractor.feed(chunk)
+                if audio:
+                    yield audio
+        finally:
+            await stack.aclose()
+
+    return StreamingResponse(
+        reply_audio(),
+        media_type="audio/wav",
+        headers={"Content-Disposition": "attachment; filename=response.wav"}
+    )
+
+@app.websocket("/ws/conversation")
+async def conversation(websocket: WebSocket):
+    """
+    Real-time conversation: audio frames in, reply audio streamed back per utterance.
+    See ConversationSession for the message protocol.
+    """
+    await websocket.accept()
+    await ConversationSession(websocket, ultravox_client, DEFAULT_PROMPT, ULTRAVOX_MODEL).run()
+
+@app.post("/jobs", status_code=202)
+async def create_job(files: List[UploadFile] = File(None), urls: List[str] = Form(None)):
+    """
+    Start a batch job over uploaded files and/or http(s) URLs.
+    Items are processed in the background; poll GET /jobs/{job_id}.
+    """
+    files, urls = files or [], urls or []
+    if not files and not urls:
+        raise HTTPException(status_code=400, detail="Provide at least one file or URL")
+    try:
+        job = await job_manager.submit(files, urls)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "job_id": job.id,
+        "total": job.meta["total"],
+        "status_url": f"/jobs/{job.id}",
+        "results_url": f"/jobs/{job.id}/results",
+    }
+
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Progress of a batch job"""
+    return job_manager.status(get_job(job_id))
+
+@app.get("/jobs/{job_id}/results")
+async def job_results(job_id: str):
+    """Results so far, one JSON line per finished item"""
+    job = get_job(job_id)
+    if not os.path.exists(job.results_path):
+        return Response(content=b"", media_type="application/x-ndjson")
+    return FileResponse(job.results_path, media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}/replies/{index}")
+async def job_reply(job_id: str, index: int):
+    """Reply audio of one finished item"""
+    path = get_job(job_id).reply_path(index)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"No reply for item {index}")
+    return FileResponse(path, media_type="audio/wav")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Stop a batch job; finished results are kept"""
+    job = get_job(job_id)
+    await job_manager.cancel(job)
+    return job_manager.status(job)
+
+# Mounted last so the API routes above take precedence
+if FRONTEND_DIR:
+    app.mount(FRONTEND_PATH, StaticAssetsApp(AssetIndex(FRONTEND_DIR, FRONTEND_CACHE_DIR)), name="frontend")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8080))
     logger.info(f"Starting server on port {port}")
-    uvicorn.run("app:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
+    uvicorn.run("app:app", host="0.0.0.0", port=port, reload=False)
@@ -0,0 +1,143 @@
+# audio_pool.py
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the worker pool queue is full and the job is rejected"""
+
+    def __init__(self, retry_after: int, reason: str = "Audio worker pool is saturated"):
+        super().__init__(f"{reason}, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PoolRestartedError(PoolSaturatedError):
+    """Raised for jobs lost when a worker process died and the pool was rebuilt"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(retry_after, "Audio worker pool restarted after a worker died")
+
+
+class AudioWorkerPool:
+    """
+    Bounded process or thread pool for CPU-bound audio work.
+
+    At most max_workers jobs run at once and at most max_queue more wait for a
+    worker; anything beyond that is rejected immediately with PoolSaturatedError
+    so the caller can answer 503 instead of piling up latency.
+    """
+
+    def __init__(
+        self,
+        kind: str = "process",
+        max_workers: Optional[int] = None,
+        max_queue: int = 32,
+        retry_after: int = 1,
+    ):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown audio pool kind: {kind}")
+
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+
+        self._executor: Executor = self._create_executor()
+
+        # Jobs submitted and not yet finished in the executor; updated from its threads
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._restarts = 0
+
+    def _create_executor(self) -> Executor:
+        if self.kind == "process":
+            # spawn avoids forking the event loop and the upstream client's sockets
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="audio-worker",
+        )
+
+    def _restart(self, broken: Executor):
+        """Replace an executor whose worker died; only the first caller to notice rebuilds it"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            logger.error("Audio worker died, restarting the pool")
+            self._executor = self._create_executor()
+            self._restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) in the pool, or raise PoolSaturatedError if the queue is full"""
+        with self._lock:
+            if self._pending >= self.capacity:
+                self._rejected += 1
+                raise PoolSaturatedError(self.retry_after)
+            self._pending += 1
+
+        executor = self._executor
+        try:
+            future = executor.submit(functools.partial(fn, *args))
+        except BrokenProcessPool:
+            self._release(None)
+            self._restart(executor)
+            raise PoolRestartedError(self.retry_after)
+        except BaseException:
+            self._release(None)
+            raise
+        # The slot is held until the job itself finishes: a caller that goes away
+        # (client disconnect) only cancels jobs that have not started yet
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # A dead worker breaks the whole executor; rebuild it and let the caller retry
+            self._restart(executor)
+            raise PoolRestartedError(self.retry_after)
+
+    def _release(self, future: Optional[Future]):
+        with self._lock:
+            self._pending -= 1
+            if future is None or future.cancelled():
+                return
+            if future.exception() is None:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+    def stats(self) -> dict:
+        """Queue depth and throughput counters"""
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": min(self._pending, self.max_workers),
+            "queued": max(0, self._pending - self.max_workers),
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "restarts": self._restarts,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,436 @@
+# audio_processing.py
+import logging
+import struct
+import subprocess
+import time
+from fractions import Fraction
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from vad import speech_bounds
+
+logger = logging.getLogger(__name__)
+
+# Target format expected by UltraVox and Whisper
+TARGET_RATE = 16000
+TARGET_CHANNELS = 1
+TARGET_SAMPLE_WIDTH = 2
+
+# Input sample rates accepted; anything else is corrupt or hostile
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 192000
+
+# WAV format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Size written by streaming muxers (ffmpeg on a pipe) when the length is unknown
+WAV_UNKNOWN_SIZE = 0xFFFFFFFF
+
+# Leading bytes identifying each container, checked in order
+CONTAINER_SIGNATURES = [
+    (b"\x1a\x45\xdf\xa3", "webm"),
+    (b"OggS", "ogg"),
+    (b"fLaC", "flac"),
+    (b"ID3", "mp3"),
+    (b"\xff\xfb", "mp3"),
+    (b"\xff\xf3", "mp3"),
+    (b"\xff\xf2", "mp3"),
+]
+
+# Fallback when the bytes are not recognised
+CONTENT_TYPE_CONTAINERS = {
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/webm": "webm",
+    "video/webm": "webm",
+    "audio/ogg": "ogg",
+    "audio/opus": "ogg",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/mp4": "mp4",
+    "audio/m4a": "mp4",
+    "audio/x-m4a": "mp4",
+    "video/mp4": "mp4",
+}
+
+
+class AudioProcessingError(Exception):
+    """Custom exception for audio processing errors"""
+    pass
+
+
+class WavInfo(NamedTuple):
+    format_tag: int
+    channels: int
+    frame_rate: int
+    sample_width: int
+    data_offset: int
+    data_size: int
+
+
+def sniff_container(file_bytes: bytes, content_type: Optional[str] = None) -> Optional[str]:
+    """
+    Identify the audio container from its magic bytes, falling back to the
+    declared content type. Returns None when neither is recognised.
+    """
+    head = bytes(file_bytes[:12])
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    for signature, container in CONTAINER_SIGNATURES:
+        if head.startswith(signature):
+            return container
+
+    if content_type:
+        return CONTENT_TYPE_CONTAINERS.get(content_type.split(";")[0].strip().lower())
+    return None
+
+
+def parse_wav_header(file_bytes: bytes) -> WavInfo:
+    """
+    Walk the RIFF chunks of a WAV file and locate the fmt and data chunks.
+    A data size that is unknown (streamed) or overruns the buffer means
+    "until the end of the file".
+    """
+    view = memoryview(file_bytes)
+    if len(view) < 12 or view[:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise AudioProcessingError("Not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = struct.unpack_from("<I", view, offset + 4)[0]
+        body = offset + 8
+
+        if chunk_id != b"data" and body + chunk_size > len(view):
+            # Truncated header, e.g. a partially received stream
+            break
+
+        if chunk_id == b"fmt ":
+            format_tag, channels, frame_rate, _, _, bits = struct.unpack_from("<HHIIHH", view, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # The real format tag is the first two bytes of the SubFormat GUID
+                format_tag = struct.unpack_from("<H", view, body + 24)[0]
+            fmt = (format_tag, channels, frame_rate, bits // 8)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioProcessingError("WAV data chunk precedes fmt chunk")
+            if chunk_size == WAV_UNKNOWN_SIZE or chunk_size == 0 or body + chunk_size > len(view):
+                chunk_size = len(view) - body
+            return WavInfo(*fmt, data_offset=body, data_size=chunk_size)
+
+        # Chunks are padded to an even length
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise AudioProcessingError("WAV file has no data chunk")
+
+
+def check_sample_rate(frame_rate: int):
+    """Reject sample rates outside MIN_SAMPLE_RATE..MAX_SAMPLE_RATE"""
+    if not MIN_SAMPLE_RATE <= frame_rate <= MAX_SAMPLE_RATE:
+        raise AudioProcessingError(
+            f"Unsupported sample rate {frame_rate}Hz, expected {MIN_SAMPLE_RATE}-{MAX_SAMPLE_RATE}Hz"
+        )
+
+
+def wav_header(data_size: Optional[int] = None, frame_rate: int = TARGET_RATE,
+               channels: int = TARGET_CHANNELS, sample_width: int = TARGET_SAMPLE_WIDTH) -> bytes:
+    """
+    Build a 44-byte PCM WAV header. Pass data_size=None for a streamed file of
+    unknown length; the size fields are then set to 0xFFFFFFFF like ffmpeg does.
+    """
+    if data_size is None:
+        riff_size = data_size = WAV_UNKNOWN_SIZE
+    else:
+        riff_size = 36 + data_size
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, WAVE_FORMAT_PCM, channels, frame_rate,
+        frame_rate * block_align, block_align, sample_width * 8,
+        b"data", data_size,
+    )
+
+
+def pcm_to_float(data, format_tag: int, sample_width: int) -> np.ndarray:
+    """Interpret raw interleaved PCM as float32 samples in [-1, 1]"""
+    usable = len(data) - len(data) % sample_width
+    data = data[:usable]
+
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        dtype = {4: "<f4", 8: "<f8"}.get(sample_width)
+        if dtype is None:
+            raise AudioProcessingError(f"Unsupported float sample width: {sample_width}")
+        return np.frombuffer(data, dtype=dtype).astype(np.float32)
+
+    if format_tag != WAVE_FORMAT_PCM:
+        raise AudioProcessingError(f"Unsupported WAV format tag: {format_tag:#06x}")
+
+    if sample_width == 1:
+        # 8-bit WAV is unsigned
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if sample_width == 2:
+        return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    if sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(samples & 0x800000, samples - 0x1000000, samples)
+        return samples.astype(np.float32) / 8388608.0
+    if sample_width == 4:
+        return np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648.0
+    raise AudioProcessingError(f"Unsupported PCM sample width: {sample_width}")
+
+
+def float_to_pcm16(samples: np.ndarray) -> bytes:
+    """Convert float samples to little-endian PCM16 with clipping"""
+    scaled = np.rint(samples * 32768.0)
+    np.clip(scaled, -32768, 32767, out=scaled)
+    return scaled.astype("<i2").tobytes()
+
+
+def downmix(samples: np.ndarray, channels: int) -> np.ndarray:
+    """Average interleaved channels into mono"""
+    if channels == 1:
+        return samples
+    frames = len(samples) // channels
+    return samples[:frames * channels].reshape(frames, channels).mean(axis=1, dtype=np.float32)
+
+
+def wav_to_float(wav_bytes: bytes) -> np.ndarray:
+    """Decode a PCM or float WAV into mono float32 samples at its own rate"""
+    wav = parse_wav_header(wav_bytes)
+    data = memoryview(wav_bytes)[wav.data_offset:wav.data_offset + wav.data_size]
+    return downmix(pcm_to_float(data, wav.format_tag, wav.sample_width), wav.channels)
+
+
+class PolyphaseResampler:
+    """
+    Rational-ratio resampler using a Kaiser-windowed sinc low-pass filter
+    split into polyphase branches, so only the taps that hit real input
+    samples are ever multiplied.
+
+    Works incrementally: feed chunks with process() and call flush() once
+    the input is complete. Output is identical to a one-shot run over the
+    concatenated input.
+    """
+
+    # Zero crossings of the sinc kernel on each side, and the Kaiser beta
+    HALF_WIDTH = 10
+    KAISER_BETA = 5.0
+
+    # Outputs computed per vectorised block, bounds the gather matrix size
+    BLOCK = 16384
+
+    # Largest decimation factor; the filter grows with it, so odd rate pairs
+    # (191999 -> 16000) are approximated instead. Every standard rate is exact.
+    MAX_DOWN = 1000
+
+    def __init__(self, rate_in: int, rate_out: int):
+        ratio = Fraction(rate_out, rate_in).limit_denominator(self.MAX_DOWN)
+        self.up = ratio.numerator
+        self.down = ratio.denominator
+
+        # Prototype low-pass filter at the upsampled rate
+        ratio = max(self.up, self.down)
+        half_len = self.HALF_WIDTH * ratio
+        n = np.arange(-half_len, half_len + 1, dtype=np.float64)
+        cutoff = 1.0 / ratio
+        taps = cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), self.KAISER_BETA) * self.up
+
+        # Split into polyphase branches: phases[p, j] = taps[p + up * j]
+        self.branch_len = -(-len(taps) // self.up)
+        padded = np.zeros(self.branch_len * self.up)
+        padded[:len(taps)] = taps
+        self.phases = padded.reshape(self.branch_len, self.up).T.astype(np.float32)
+        self.delay = half_len
+
+        # Input history; _buffer[0] is absolute input sample _buffer_start.
+        # Starts with zeros standing in for samples before the signal begins.
+        self._buffer = np.zeros(self.branch_len, dtype=np.float32)
+        self._buffer_start = -self.branch_len
+        self._received = 0
+        self._next_output = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Consume input samples and return every output sample now computable"""
+        samples = np.asarray(samples, dtype=np.float32)
+        self._buffer = np.concatenate((self._buffer, samples))
+        self._received += len(samples)
+        # Output n needs input up to (n * down + delay) // up
+        last = (self.up * self._received - 1 - self.delay) // self.down
+        return self._emit(last + 1)
+
+    def flush(self) -> np.ndarray:
+        """Zero-pad the tail and return the remaining output samples"""
+        total = -(-self._received * self.up // self.down)
+        tail = -(-self.delay // self.up) + 1
+        self._buffer = np.concatenate((self._buffer, np.zeros(tail, dtype=np.float32)))
+        return self._emit(total)
+
+    def _emit(self, stop: int) -> np.ndarray:
+        if stop <= self._next_output:
+            return np.zeros(0, dtype=np.float32)
+
+        outputs = []
+        taps = np.arange(self.branch_len)
+        for block_start in range(self._next_output, stop, self.BLOCK):
+            n = np.arange(block_start, min(block_start + self.BLOCK, stop), dtype=np.int64)
+            t = n * self.down + self.delay
+            base = t // self.up - self._buffer_start
+            frames = self._buffer[base[:, None] - taps[None, :]]
+            outputs.append(np.einsum("ij,ij->i", frames, self.phases[t % self.up]))
+        self._next_output = stop
+
+        # Drop history that no future output can reach
+        oldest = (self._next_output * self.down + self.delay) // self.up - self.branch_len + 1
+        drop = oldest - self._buffer_start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start = oldest
+
+        return np.concatenate(outputs)
+
+
+def resample(samples: np.ndarray, rate_in: int, rate_out: int = TARGET_RATE) -> np.ndarray:
+    """One-shot polyphase resampling"""
+    if rate_in == rate_out:
+        return samples
+    resampler = PolyphaseResampler(rate_in, rate_out)
+    head = resampler.process(samples)
+    return np.concatenate((head, resampler.flush()))
+
+
+def decode_with_ffmpeg(file_bytes: bytes, container: Optional[str]) -> bytes:
+    """Decode any container ffmpeg understands into a PCM16 WAV at its native rate and layout"""
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if container in ("webm", "ogg", "flac", "mp3"):
+        command += ["-f", "matroska" if container == "webm" else container]
+    command += ["-i", "pipe:0", "-vn", "-f", "wav", "-acodec", "pcm_s16le", "pipe:1"]
+
+    result = subprocess.run(command, input=file_bytes, capture_output=True)
+    if result.returncode != 0:
+        raise AudioProcessingError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def _audio_info(container: Optional[str], wav: WavInfo, timings: dict) -> dict:
+    frames = wav.data_size // (wav.sample_width * wav.channels)
+    return {
+        "container": container or "unknown",
+        "channels": wav.channels,
+        "sample_width": wav.sample_width,
+        "frame_rate": wav.frame_rate,
+        "duration_ms": round(1000 * frames / wav.frame_rate) if wav.frame_rate else 0,
+        "timings_ms": timings,
+    }
+
+
+def _is_target_wav(container: Optional[str], wav: WavInfo, file_size: int) -> bool:
+    """A WAV already in the target format, with nothing after its data"""
+    return (container == "wav"
+            and wav.format_tag == WAVE_FORMAT_PCM
+            and wav.channels == TARGET_CHANNELS
+            and wav.frame_rate == TARGET_RATE
+            and wav.sample_width == TARGET_SAMPLE_WIDTH
+            and wav.data_offset + wav.data_size == file_size)
+
+
+def passthrough_info(file_bytes: bytes, content_type: Optional[str] = None) -> Optional[dict]:
+    """
+    audio_info for an upload that normalize_audio (without trimming) would
+    return unchanged, or None when it needs processing. Only reads the
+    header, so it is cheap enough for the event loop.
+    """
+    started = time.perf_counter()
+    container = sniff_container(file_bytes, content_type)
+    if container != "wav":
+        return None
+    try:
+        wav = parse_wav_header(file_bytes)
+    except AudioProcessingError:
+        # Let normalize_audio report it
+        return None
+    if not _is_target_wav(container, wav, len(file_bytes)):
+        return None
+    audio_info = _audio_info(container, wav, {"decode": round(1000 * (time.perf_counter() - started), 3)})
+    audio_info["passthrough"] = True
+    return audio_info
+
+
+def normalize_audio(file_bytes: bytes, content_type: str, trim_silence: bool = False) -> tuple[bytes, dict]:
+    """
+    Decode an uploaded audio file and convert it to 16kHz mono PCM16 WAV.
+
+    WAV input is parsed directly; anything else is decoded by a single ffmpeg
+    process. Downmixing and resampling are done with NumPy. Input that is
+    already 16kHz mono PCM16 WAV is returned as-is without decoding. With
+    trim_silence, leading and trailing non-speech is cut off. Time spent in
+    each stage is reported in audio_info["timings_ms"].
+
+    CPU-bound and blocking; runs inside the audio worker pool, so it must stay
+    a module-level function that can be pickled into a worker process.
+    Returns: (processed_audio_bytes, audio_info)
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    def lap(stage: str):
+        nonlocal started
+        now = time.perf_counter()
+        timings[stage] = round(1000 * (now - started), 3)
+        started = now
+
+    try:
+        container = sniff_container(file_bytes, content_type)
+        wav_bytes = file_bytes if container == "wav" else decode_with_ffmpeg(file_bytes, container)
+        wav = parse_wav_header(wav_bytes)
+        check_sample_rate(wav.frame_rate)
+        lap("decode")
+
+        frames = wav.data_size // (wav.sample_width * wav.channels)
+        audio_info = _audio_info(container, wav, timings)
+        logger.debug(f"Audio properties: {audio_info}")
+
+        data = memoryview(wav_bytes)[wav.data_offset:wav.data_offset + wav.data_size]
+
+        if _is_target_wav(container, wav, len(file_bytes)):
+            # Already in the target format
+            audio_info["passthrough"] = True
+            if not trim_silence:
+                return file_bytes, audio_info
+            start, end = speech_bounds(pcm_to_float(data, WAVE_FORMAT_PCM, TARGET_SAMPLE_WIDTH), TARGET_RATE)
+            lap("trim")
+            audio_info["trimmed_ms"] = round(1000 * (frames - (end - start)) / TARGET_RATE)
+            if end - start == frames:
+                return file_bytes, audio_info
+            pcm = data[start * TARGET_SAMPLE_WIDTH:end * TARGET_SAMPLE_WIDTH]
+            return wav_header(len(pcm)) + pcm, audio_info
+
+        samples = pcm_to_float(data, wav.format_tag, wav.sample_width)
+        samples = downmix(samples, wav.channels)
+        samples = resample(samples, wav.frame_rate, TARGET_RATE)
+        lap("resample")
+
+        if trim_silence:
+            start, end = speech_bounds(samples, TARGET_RATE)
+            lap("trim")
+            audio_info["trimmed_ms"] = round(1000 * (len(samples) - (end - start)) / TARGET_RATE)
+            samples = samples[start:end]
+
+        pcm = float_to_pcm16(samples)
+        lap("pack")
+        audio_info["passthrough"] = False
+        return wav_header(len(pcm)) + pcm, audio_info
+
+    except Exception as e:
+        logger.error(f"Error processing audio: {str(e)}", exc_info=True)
+        raise AudioProcessingError(f"Failed to process audio: {str(e)}")
@@ -0,0 +1,334 @@
+# audio_stream.py
+import asyncio
+import base64
+import json
+import logging
+import re
+import struct
+from typing import AsyncIterator, Optional
+
+import numpy as np
+
+from audio_processing import (
+    TARGET_CHANNELS,
+    TARGET_RATE,
+    TARGET_SAMPLE_WIDTH,
+    WAV_UNKNOWN_SIZE,
+    WAVE_FORMAT_PCM,
+    AudioProcessingError,
+    PolyphaseResampler,
+    check_sample_rate,
+    downmix,
+    float_to_pcm16,
+    parse_wav_header,
+    pcm_to_float,
+    sniff_container,
+    wav_header,
+)
+
+logger = logging.getLogger(__name__)
+
+# Read size for uploads and subprocess pipes
+CHUNK_SIZE = 64 * 1024
+
+# Give up looking for a WAV data chunk after this many header bytes
+MAX_WAV_HEADER = 64 * 1024
+
+
+class StreamingNormalizer:
+    """
+    Incremental counterpart of normalize_audio for WAV byte streams.
+
+    Feed arbitrary slices of a WAV file (header first), or of headerless PCM
+    via for_raw_pcm(), and get back 16kHz mono PCM16 samples as soon as they
+    can be computed. Only the samples still needed by the resampler filter
+    are kept in memory.
+    """
+
+    def __init__(self):
+        self._header = bytearray()
+        self._pending = b""
+        self._remaining: Optional[int] = None
+        self._frame_size = 0
+        self._format_tag = WAVE_FORMAT_PCM
+        self._sample_width = TARGET_SAMPLE_WIDTH
+        self._channels = TARGET_CHANNELS
+        self._resampler: Optional[PolyphaseResampler] = None
+        self._passthrough = False
+        self.info: Optional[dict] = None
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Consume a slice of the WAV stream and return any PCM16 output ready"""
+        if self.info is None:
+            self._header += chunk
+            chunk = self._parse_header()
+            if chunk is None:
+                return b""
+
+        if self._remaining is not None:
+            chunk = chunk[:self._remaining]
+            self._remaining -= len(chunk)
+
+        data = self._pending + chunk
+        usable = len(data) - len(data) % self._frame_size
+        self._pending = data[usable:]
+        return self._convert(data[:usable])
+
+    def finish(self) -> bytes:
+        """Flush the resampler tail once the input is complete"""
+        if self.info is None:
+            raise AudioProcessingError("Stream ended before a WAV data chunk was found")
+        if self._passthrough:
+            return b""
+        tail = self._resampler.flush() if self._resampler else np.zeros(0, dtype=np.float32)
+        return float_to_pcm16(tail)
+
+    def _parse_header(self) -> Optional[bytes]:
+        try:
+            wav = parse_wav_header(bytes(self._header))
+        except AudioProcessingError:
+            if len(self._header) > MAX_WAV_HEADER:
+                raise
+            return None
+
+        declared = struct.unpack_from("<I", self._header, wav.data_offset - 4)[0]
+        if declared not in (0, WAV_UNKNOWN_SIZE):
+            self._remaining = declared
+
+        self._configure(wav.format_tag, wav.sample_width, wav.frame_rate, wav.channels)
+        logger.info(f"Streaming audio properties: {self.info}")
+
+        data = bytes(self._header[wav.data_offset:])
+        self._header = bytearray()
+        return data
+
+    @classmethod
+    def for_raw_pcm(cls, format_tag: int, sample_width: int, frame_rate: int, channels: int):
+        """Normalizer for headerless interleaved PCM, e.g. live capture frames"""
+        normalizer = cls()
+        normalizer._configure(format_tag, sample_width, frame_rate, channels)
+        return normalizer
+
+    def _configure(self, format_tag: int, sample_width: int, frame_rate: int, channels: int):
+        check_sample_rate(frame_rate)
+        self._format_tag = format_tag
+        self._sample_width = sample_width
+        self._channels = channels
+        self._frame_size = sample_width * channels
+        self._passthrough = (
+            format_tag == WAVE_FORMAT_PCM
+            and channels == TARGET_CHANNELS
+            and frame_rate == TARGET_RATE
+            and sample_width == TARGET_SAMPLE_WIDTH
+        )
+        if frame_rate != TARGET_RATE:
+            self._resampler = PolyphaseResampler(frame_rate, TARGET_RATE)
+
+        self.info = {
+            "container": "wav",
+            "channels": channels,
+            "sample_width": sample_width,
+            "frame_rate": frame_rate,
+            "passthrough": self._passthrough,
+        }
+
+    def _convert(self, data: bytes) -> bytes:
+        if not data:
+            return b""
+        if self._passthrough:
+            return data
+        samples = pcm_to_float(data, self._format_tag, self._sample_width)
+        samples = downmix(samples, self._channels)
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        return float_to_pcm16(samples)
+
+
+class FfmpegTranscoder:
+    """
+    Runs ffmpeg as a stdin/stdout filter that turns any supported container
+    into a PCM16 WAV stream at the source's native rate and layout.
+    """
+
+    def __init__(self, source: AsyncIterator[bytes]):
+        self._source = source
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0", "-vn", "-f", "wav", "-acodec", "pcm_s16le", "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        writer = asyncio.create_task(self._write(process))
+        errors = asyncio.create_task(process.stderr.read())
+        try:
+            while True:
+                chunk = await process.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+            await writer
+            returncode = await process.wait()
+            if returncode != 0:
+                stderr = (await errors).decode(errors="replace").strip()
+                raise AudioProcessingError(f"ffmpeg failed: {stderr}")
+        finally:
+            writer.cancel()
+            errors.cancel()
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    async def _write(self, process):
+        try:
+            async for chunk in self._source:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg exited early; its return code carries the error
+            pass
+
+
+async def iter_upload(file, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Read an UploadFile in fixed-size chunks"""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def normalized_pcm_stream(
+    source: AsyncIterator[bytes],
+    content_type: Optional[str],
+    info: Optional[dict] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream raw 16kHz mono PCM16 from an uploaded file of any container.
+
+    WAV input is converted in-process; other containers are piped through
+    ffmpeg first. Conversion work runs in a thread so the event loop stays
+    free. Audio properties are written into info once known.
+    """
+    first = b""
+    async for first in source:
+        if first:
+            break
+    container = sniff_container(first, content_type)
+
+    async def replay() -> AsyncIterator[bytes]:
+        yield first
+        async for chunk in source:
+            yield chunk
+
+    wav_stream = replay() if container == "wav" else FfmpegTranscoder(replay())
+    normalizer = StreamingNormalizer()
+    async for chunk in wav_stream:
+        pcm = await asyncio.to_thread(normalizer.feed, chunk)
+        if pcm:
+            yield pcm
+    tail = await asyncio.to_thread(normalizer.finish)
+    if tail:
+        yield tail
+
+    if info is not None:
+        info.update(normalizer.info, container=container or "unknown")
+
+
+class Base64Encoder:
+    """Incremental base64 encoder; carries partial 3-byte groups between chunks"""
+
+    def __init__(self):
+        self._carry = b""
+
+    def encode(self, chunk: bytes) -> bytes:
+        data = self._carry + chunk
+        usable = len(data) - len(data) % 3
+        self._carry = data[usable:]
+        return base64.b64encode(data[:usable])
+
+    def finish(self) -> bytes:
+        data, self._carry = self._carry, b""
+        return base64.b64encode(data)
+
+
+async def ultravox_request_body(
+    pcm_stream: AsyncIterator[bytes],
+    prompt: str,
+    model: str,
+    data_size: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream the UltraVox JSON payload with the audio base64-encoded on the fly.
+
+    Produces the same document call_ultravox_api sends, but the WAV is never
+    held in memory. Unless data_size is given the length is not known up
+    front, so the WAV header uses the streaming 0xFFFFFFFF size marker.
+    """
+    # Split the JSON around a placeholder so the audio can be spliced in
+    marker = "\u0000AUDIO\u0000"
+    document = json.dumps({
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": f"content: {prompt}\naudio_data: {marker}"
+            }
+        ]
+    })
+    prefix, suffix = document.split(json.dumps(marker)[1:-1])
+
+    encoder = Base64Encoder()
+    yield prefix.encode("utf-8")
+    yield encoder.encode(wav_header(data_size))
+    async for pcm in pcm_stream:
+        encoded = encoder.encode(pcm)
+        if encoded:
+            yield encoded
+    yield encoder.finish()
+    yield suffix.encode("utf-8")
+
+
+class AudioFieldExtractor:
+    """
+    Incrementally pulls the base64 "audio" string out of an UltraVox JSON
+    response and decodes it, without buffering the whole document.
+    """
+
+    KEY = re.compile(rb'"audio"\s*:\s*"')
+
+    def __init__(self):
+        self._scan = b""
+        self._carry = b""
+        self.found = False
+        self.done = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Return the decoded audio bytes contained in this chunk"""
+        if self.done:
+            return b""
+
+        if not self.found:
+            self._scan += chunk
+            match = self.KEY.search(self._scan)
+            if match is None:
+                # Keep enough of the tail to match a key split across chunks
+                self._scan = self._scan[-32:]
+                return b""
+            self.found = True
+            chunk, self._scan = self._scan[match.end():], b""
+
+        end = chunk.find(b'"')
+        if end != -1:
+            chunk = chunk[:end]
+            self.done = True
+
+        # JSON encoders may escape "/" as "\/"
+        data = self._carry + chunk.replace(b"\\", b"")
+        usable = len(data) if self.done else len(data) - len(data) % 4
+        self._carry = data[usable:]
+        return base64.b64decode(data[:usable])
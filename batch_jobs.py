@@ -0,0 +1,568 @@
+# batch_jobs.py
+"""
+Bulk processing of recordings through the decode-then-UltraVox flow.
+
+A job is a directory:
+
+    job.json         id, creation time, item count and state
+    manifest.jsonl   one item per line: {"index", "source", "content_type"}
+    results.jsonl    one line per finished item, appended as items complete
+    replies/         reply WAV of each successful item, named by index
+    inputs/          files uploaded through the API
+
+results.jsonl is the checkpoint: when a job is started again, items with
+an "ok" result are skipped and everything else is run again. The service
+exposes jobs under /jobs; the command line runs them directly:
+
+    python batch_jobs.py run recordings/ --out backfill/ --concurrency 64
+    python batch_jobs.py run manifest.jsonl --out backfill/
+    python batch_jobs.py status backfill/
+
+A manifest line is {"file": ...} (relative to the manifest) or {"url": ...},
+with an optional "content_type". Running the same command again resumes.
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+import httpx
+
+from audio_pool import PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".webm", ".ogg", ".opus", ".flac", ".mp3", ".m4a", ".mp4")
+
+# States a job does not leave on its own; anything else is resumed
+FINAL_STATES = ("done", "cancelled")
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+# Limits on downloading URL items
+MAX_DOWNLOAD_BYTES = 100 * 1024 * 1024
+MAX_REDIRECTS = 5
+
+
+class JobItem(NamedTuple):
+    index: int
+    source: str
+    content_type: Optional[str] = None
+
+
+class FetchPolicy(NamedTuple):
+    """
+    Which URL items may be downloaded. With allowed_hosts set, only those
+    hosts are fetched; otherwise any host that resolves to public addresses
+    only, unless allow_private is set.
+    """
+    max_bytes: int = MAX_DOWNLOAD_BYTES
+    allowed_hosts: tuple = ()
+    allow_private: bool = False
+
+
+def is_url(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+async def check_url(url: str, policy: FetchPolicy) -> Optional[str]:
+    """
+    Raise ValueError unless the policy allows fetching url. Returns the
+    checked address the connection must be made to, or None when any
+    address the host resolves to is acceptable.
+    """
+    if not is_url(url):
+        raise ValueError(f"Not an http(s) URL: {url}")
+    try:
+        host = httpx.URL(url).host
+    except httpx.InvalidURL as e:
+        raise ValueError(f"Invalid URL {url}: {e}")
+    if not host:
+        raise ValueError(f"No host in URL: {url}")
+    if policy.allowed_hosts:
+        if host.lower() not in policy.allowed_hosts:
+            raise ValueError(f"Host not allowed: {host}")
+        return None
+    if policy.allow_private:
+        return None
+
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, None)
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve {host}: {e}")
+    checked = [ipaddress.ip_address(sockaddr[0].split("%", 1)[0]) for *_, sockaddr in addresses]
+    for address in checked:
+        if not address.is_global:
+            raise ValueError(f"Refusing to fetch {url}: {host} resolves to non-public address {address}")
+    return str(checked[0])
+
+
+async def fetch_url(client: httpx.AsyncClient, url: str, policy: FetchPolicy) -> tuple[bytes, Optional[str]]:
+    """
+    Download a URL item within the policy, returning (body, content type).
+    Redirects are followed by hand so every hop is checked. When the host
+    had to be checked, the connection goes to the very address that was
+    checked (keeping the Host header and TLS server name), so a second DNS
+    answer cannot point it elsewhere.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        address = await check_url(url, policy)
+        target = httpx.URL(url)
+        headers, extensions = {}, {}
+        if address is not None:
+            headers["Host"] = target.netloc.decode("ascii")
+            if target.scheme == "https":
+                extensions["sni_hostname"] = target.host
+            target = target.copy_with(host=address)
+        async with client.stream("GET", target, headers=headers, extensions=extensions,
+                                 follow_redirects=False) as response:
+            if response.is_redirect:
+                url = str(httpx.URL(url).join(response.headers["location"]))
+                continue
+            response.raise_for_status()
+            declared = response.headers.get("content-length", "")
+            if declared.isdigit() and int(declared) > policy.max_bytes:
+                raise ValueError(f"{url} is {declared} bytes, over the {policy.max_bytes} byte limit")
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > policy.max_bytes:
+                    raise ValueError(f"{url} is over the {policy.max_bytes} byte limit")
+            return bytes(body), response.headers.get("content-type")
+    raise ValueError(f"More than {MAX_REDIRECTS} redirects fetching {url}")
+
+
+def items_from_directory(directory: str) -> list:
+    """Every audio file under a directory, in a stable order"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(AUDIO_EXTENSIONS))
+    return [JobItem(index, os.path.abspath(path)) for index, path in enumerate(paths)]
+
+
+def items_from_manifest(path: str) -> list:
+    """
+    Items from a JSONL manifest of {"file"|"url", "content_type"} lines.
+    Raises ValueError naming the first invalid line.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: not valid JSON ({e})")
+            if not isinstance(entry, dict):
+                raise ValueError(f"{path}:{number}: expected a JSON object")
+            url, file = entry.get("url"), entry.get("file")
+            if isinstance(url, str) and is_url(url):
+                source = url
+            elif isinstance(file, str) and file:
+                source = os.path.join(base, file)
+            else:
+                raise ValueError(f'{path}:{number}: expected an http(s) "url" or a "file" path')
+            content_type = entry.get("content_type")
+            if content_type is not None and not isinstance(content_type, str):
+                raise ValueError(f'{path}:{number}: "content_type" must be a string')
+            items.append(JobItem(len(items), source, content_type))
+    return items
+
+
+def write_json_atomic(path: str, value: dict):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(value, f, indent=2)
+    os.replace(temp_path, path)
+
+
+class Job:
+    """A job directory; see the module docstring for its layout"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(self._path("job.json")) as f:
+            self.meta = json.load(f)
+        self.id = self.meta["id"]
+
+    @classmethod
+    def create(cls, directory: str, items: list, job_id: Optional[str] = None) -> "Job":
+        os.makedirs(os.path.join(directory, "replies"), exist_ok=True)
+        with open(os.path.join(directory, "manifest.jsonl"), "w") as f:
+            for item in items:
+                f.write(json.dumps(item._asdict()) + "\n")
+        write_json_atomic(os.path.join(directory, "job.json"), {
+            "id": job_id or uuid.uuid4().hex,
+            "created_at": time.time(),
+            "total": len(items),
+            "state": "queued",
+        })
+        return cls(directory)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def results_path(self) -> str:
+        return self._path("results.jsonl")
+
+    def reply_path(self, index: int) -> str:
+        return self._path(os.path.join("replies", f"{index:06d}.wav"))
+
+    def items(self) -> list:
+        with open(self._path("manifest.jsonl")) as f:
+            return [JobItem(**json.loads(line)) for line in f if line.strip()]
+
+    def results(self) -> dict:
+        """Latest result per item index"""
+        results = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path) as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        # Line cut short by a crash; the item simply runs again
+                        continue
+                    results[result["index"]] = result
+        return results
+
+    def set_state(self, state: str, **extra):
+        self.meta.update(extra, state=state)
+        write_json_atomic(self._path("job.json"), self.meta)
+
+    def status(self) -> dict:
+        """Progress as recorded on disk"""
+        results = self.results().values()
+        ok = sum(1 for r in results if r["status"] == "ok")
+        return {**self.meta, "ok": ok, "failed": len(results) - ok, "pending": self.meta["total"] - len(results)}
+
+
+class JobRunner:
+    """
+    Runs a job's unfinished items with a fixed number of concurrent workers.
+
+    Each item is read (or downloaded), normalized with `process` and sent
+    upstream with `reply`; the reply WAV is written to disk and a result line
+    appended as soon as the item finishes. When the audio pool is saturated,
+    workers back off for its Retry-After instead of failing the item.
+    """
+
+    def __init__(self, job: Job, process: Callable[[bytes, Optional[str]], Awaitable[tuple]],
+                 reply: Callable[[bytes], Awaitable[tuple]], concurrency: int = 16,
+                 http_client: Optional[httpx.AsyncClient] = None, fetch_policy: FetchPolicy = FetchPolicy()):
+        if concurrency < 1:
+            raise ValueError(f"Job concurrency must be at least 1, got {concurrency}")
+        self.job = job
+        self.process = process
+        self.reply = reply
+        self.concurrency = concurrency
+        self.http_client = http_client
+        self.fetch_policy = fetch_policy
+
+        self._pending = deque()
+        self._in_progress = 0
+        self._ok = 0
+        self._failed = 0
+        self._finished = 0
+        self._started = None
+
+    async def run(self) -> dict:
+        previous = self.job.results()
+        self._ok = sum(1 for r in previous.values() if r["status"] == "ok")
+        done = {index for index, r in previous.items() if r["status"] == "ok"}
+        self._pending = deque(item for item in self.job.items() if item.index not in done)
+        logger.info(f"Job {self.job.id}: {len(self._pending)} items to run, {len(done)} already done")
+
+        self.job.set_state("running")
+        self._started = time.perf_counter()
+        owns_client = self.http_client is None
+        if owns_client:
+            self.http_client = httpx.AsyncClient(timeout=60)
+        try:
+            with open(self.job.results_path, "a") as results_file:
+                # Terminate a line left half-written by a crash so the next result starts cleanly
+                if not _ends_with_newline(self.job.results_path):
+                    results_file.write("\n")
+                workers = min(self.concurrency, len(self._pending))
+                await asyncio.gather(*(self._worker(results_file) for _ in range(workers)))
+        finally:
+            if owns_client:
+                await self.http_client.aclose()
+
+        self.job.set_state("done", finished_at=time.time())
+        return self.progress()
+
+    async def _worker(self, results_file):
+        while self._pending:
+            item = self._pending.popleft()
+            self._in_progress += 1
+            try:
+                result = await self._run_item(item)
+            finally:
+                self._in_progress -= 1
+            self._finished += 1
+            if result["status"] == "ok":
+                self._ok += 1
+            else:
+                self._failed += 1
+            results_file.write(json.dumps(result) + "\n")
+            results_file.flush()
+
+    async def _run_item(self, item: JobItem) -> dict:
+        started = time.perf_counter()
+        result = {"index": item.index, "source": item.source}
+        try:
+            data, content_type = await self._load(item)
+            while True:
+                try:
+                    processed_audio, audio_info = await self.process(data, content_type)
+                    break
+                except PoolSaturatedError as e:
+                    await asyncio.sleep(e.retry_after)
+
+            reply_audio, _ = await self.reply(processed_audio)
+            path = self.job.reply_path(item.index)
+            await asyncio.to_thread(_write_file, path, reply_audio)
+            result.update(
+                status="ok",
+                reply=os.path.relpath(path, self.job.directory),
+                reply_bytes=len(reply_audio),
+                audio_info=audio_info,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # HTTPException carries the upstream error in .detail
+            detail = getattr(e, "detail", None) or str(e)
+            logger.warning(f"Job {self.job.id} item {item.index} failed: {detail}")
+            result.update(status="error", error=f"{type(e).__name__}: {detail}")
+        result["elapsed_ms"] = round(1000 * (time.perf_counter() - started), 1)
+        return result
+
+    async def _load(self, item: JobItem) -> tuple[bytes, Optional[str]]:
+        if is_url(item.source):
+            data, content_type = await fetch_url(self.http_client, item.source, self.fetch_policy)
+            return data, item.content_type or content_type
+        return await asyncio.to_thread(_read_file, item.source), item.content_type
+
+    def progress(self) -> dict:
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        rate = self._finished / elapsed if elapsed else 0.0
+        remaining = len(self._pending) + self._in_progress
+        return {
+            **self.job.meta,
+            "ok": self._ok,
+            "failed": self._failed,
+            "in_progress": self._in_progress,
+            "pending": remaining,
+            "elapsed_s": round(elapsed, 1),
+            "items_per_s": round(rate, 2),
+            "eta_s": round(remaining / rate) if rate else None,
+        }
+
+
+def _ends_with_newline(path: str) -> bool:
+    """True for an empty file or one whose last byte is a newline"""
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class JobManager:
+    """
+    Jobs submitted to the service. Each job runs in its own task; jobs left
+    unfinished by a restart are resumed by resume().
+    """
+
+    def __init__(self, jobs_dir: str, process: Callable, reply: Callable, concurrency: int = 16,
+                 fetch_policy: FetchPolicy = FetchPolicy()):
+        self.jobs_dir = jobs_dir
+        self.process = process
+        self.reply = reply
+        self.concurrency = concurrency
+        self.fetch_policy = fetch_policy
+        os.makedirs(jobs_dir, exist_ok=True)
+
+        self._runners = {}
+        self._tasks = {}
+        self._http_client = httpx.AsyncClient(timeout=60)
+
+    def _directory(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        if not JOB_ID_PATTERN.fullmatch(job_id) or not os.path.exists(os.path.join(self._directory(job_id), "job.json")):
+            return None
+        runner = self._runners.get(job_id)
+        return runner.job if runner is not None else Job(self._directory(job_id))
+
+    async def submit(self, files: list, urls: list) -> Job:
+        """
+        Create and start a job from uploaded files (objects with filename,
+        content_type and an async read()) and http(s) URLs. Uploads are
+        copied to the job directory in chunks.
+        """
+        for url in urls:
+            await check_url(url, self.fetch_policy)
+
+        job_id = uuid.uuid4().hex
+        inputs = os.path.join(self._directory(job_id), "inputs")
+        os.makedirs(inputs)
+
+        items = []
+        for upload in files:
+            name = os.path.basename(upload.filename or "") or "upload"
+            path = os.path.join(inputs, f"{len(items):06d}_{name}")
+            with open(path, "wb") as f:
+                while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                    await asyncio.to_thread(f.write, chunk)
+            items.append(JobItem(len(items), os.path.abspath(path), upload.content_type))
+        items.extend(JobItem(len(items) + i, url) for i, url in enumerate(urls))
+
+        job = Job.create(self._directory(job_id), items, job_id)
+        self._start(job)
+        return job
+
+    def _start(self, job: Job):
+        runner = JobRunner(job, self.process, self.reply, self.concurrency, self._http_client, self.fetch_policy)
+        self._runners[job.id] = runner
+        task = asyncio.create_task(runner.run())
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda t: self._finished(job.id, t))
+
+    def _finished(self, job_id: str, task: asyncio.Task):
+        self._tasks.pop(job_id, None)
+        self._runners.pop(job_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Job {job_id} stopped: {task.exception()}")
+
+    def resume(self):
+        """Restart every job that was not finished or cancelled"""
+        for job_id in sorted(os.listdir(self.jobs_dir)):
+            job = self.get(job_id)
+            if job is not None and job.meta["state"] not in FINAL_STATES and job_id not in self._tasks:
+                logger.info(f"Resuming job {job_id}")
+                self._start(job)
+
+    def status(self, job: Job) -> dict:
+        runner = self._runners.get(job.id)
+        return runner.progress() if runner is not None else job.status()
+
+    async def cancel(self, job: Job):
+        task = self._tasks.get(job.id)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if job.meta["state"] not in FINAL_STATES:
+            job.set_state("cancelled")
+
+    def stats(self) -> dict:
+        """Items waiting and running across active jobs"""
+        return {
+            "active_jobs": len(self._runners),
+            "pending_items": sum(len(r._pending) for r in self._runners.values()),
+            "in_progress_items": sum(r._in_progress for r in self._runners.values()),
+        }
+
+    async def shutdown(self):
+        """Stop running jobs without changing their state, so they resume on the next start"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._http_client.aclose()
+
+
+async def run_cli_job(job: Job, concurrency: Optional[int]) -> dict:
+    """Run a job through the service's own pipeline, printing progress"""
+    import app as service
+
+    await service.startup()
+    try:
+        runner = JobRunner(
+            job, service.process_audio_file, service.call_ultravox_api,
+            concurrency or service.ULTRAVOX_MAX_CONCURRENCY,
+            # The operator wrote the manifest, so internal hosts are fine here
+            fetch_policy=FetchPolicy(max_bytes=service.JOBS_MAX_DOWNLOAD_BYTES, allow_private=True),
+        )
+        task = asyncio.create_task(runner.run())
+        while not task.done():
+            await asyncio.wait({task}, timeout=5)
+            p = runner.progress()
+            print(f"{p['ok']} ok, {p['failed']} failed, {p['in_progress']} running, {p['pending']} left "
+                  f"({p['items_per_s']}/s, eta {p['eta_s']}s)", flush=True)
+        return task.result()
+    finally:
+        await service.shutdown()
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run recordings through the decode-then-UltraVox flow in bulk")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="start or resume a job")
+    run_parser.add_argument("source", help="directory of recordings or JSONL manifest")
+    run_parser.add_argument("--out", required=True, help="job directory for results and replies")
+    run_parser.add_argument("--concurrency", type=positive_int, default=None,
+                            help="items in flight (default ULTRAVOX_MAX_CONCURRENCY)")
+
+    status_parser = commands.add_parser("status", help="show a job's progress")
+    status_parser.add_argument("out")
+
+    args = parser.parse_args()
+    if args.command == "status":
+        print(json.dumps(Job(args.out).status(), indent=2))
+        return
+
+    if os.path.exists(os.path.join(args.out, "job.json")):
+        job = Job(args.out)
+        print(f"Resuming job {job.id} in {args.out}")
+    else:
+        try:
+            items = items_from_directory(args.source) if os.path.isdir(args.source) else items_from_manifest(args.source)
+        except ValueError as e:
+            parser.error(f"Invalid manifest: {e}")
+        if not items:
+            parser.error(f"No recordings found in {args.source}")
+        job = Job.create(args.out, items)
+        print(f"Created job {job.id} with {len(items)} items in {args.out}")
+
+    summary = asyncio.run(run_cli_job(job, args.concurrency))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# batching.py
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching in front of a batch-capable model.
+
+    Requests are queued; the worker takes the oldest one, then keeps
+    collecting until max_batch_size items are gathered or max_wait_ms has
+    passed since that first item arrived. The batch runs as one call to
+    run_batch (in a thread) and each result is handed back to its caller.
+    """
+
+    # Recent queue delays kept for percentile reporting
+    DELAY_WINDOW = 1000
+
+    def __init__(self, run_batch: Callable[[list], list], max_batch_size: int = 8, max_wait_ms: float = 20):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+
+        self._batch_sizes = Counter()
+        self._delays = deque(maxlen=self.DELAY_WINDOW)
+        self._items = 0
+        self._batch_seconds = 0.0
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                # Anything that queued up behind a running batch joins at once
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Callers that gave up while queued are dropped from the batch
+            batch = [entry for entry in batch if not entry[1].done()]
+            if batch:
+                await self._run_batch(batch)
+
+    async def _run_batch(self, batch: list):
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            self._delays.append(started - enqueued)
+        self._batch_sizes[len(batch)] += 1
+        self._items += len(batch)
+
+        try:
+            results = await asyncio.to_thread(self.run_batch, [item for item, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} failed: {str(e)}", exc_info=True)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._batch_seconds += time.perf_counter() - started
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Batch size distribution and queue delay, for tuning throughput vs latency"""
+        batches = sum(self._batch_sizes.values())
+        delays = sorted(self._delays)
+
+        def percentile(p: float) -> float:
+            if not delays:
+                return 0.0
+            return round(1000 * delays[min(len(delays) - 1, int(p * len(delays)))], 2)
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(1000 * self.max_wait, 2),
+            "queue_depth": self._queue.qsize(),
+            "batches": batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / batches, 2) if batches else 0.0,
+            "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            "avg_batch_ms": round(1000 * self._batch_seconds / batches, 2) if batches else 0.0,
+            "queue_delay_ms": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": round(1000 * delays[-1], 2) if delays else 0.0,
+            },
+        }
@@ -0,0 +1,130 @@
+# bench_corpus.py
+"""
+Generate a benchmark corpus: reference clips in the containers clients
+actually upload, at several durations, plus a requests.jsonl log for
+bench_load.py to replay.
+
+    python bench_corpus.py bench_corpus/ --durations 2 5 15 60 --requests 200
+
+Clips are synthetic voiced speech (a gliding pitch with harmonics, syllable
+envelopes and pauses) unless --source points at a real recording, which is
+looped or cut to each duration. Requires ffmpeg on PATH.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+from typing import Optional
+
+import numpy as np
+
+from audio_processing import TARGET_RATE, normalize_audio, wav_to_float
+
+# Container name -> (file extension, content type, ffmpeg output arguments)
+CONTAINERS = {
+    "wav16k": ("wav", "audio/wav", ["-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le"]),
+    "wav44k": ("wav", "audio/wav", ["-ar", "44100", "-ac", "2", "-c:a", "pcm_s16le"]),
+    "flac": ("flac", "audio/flac", ["-ar", "48000", "-ac", "1", "-c:a", "flac"]),
+    "ogg": ("ogg", "audio/ogg", ["-ar", "48000", "-ac", "1", "-c:a", "libopus", "-b:a", "32k"]),
+    "webm": ("webm", "audio/webm", ["-ar", "48000", "-ac", "1", "-c:a", "libopus", "-b:a", "32k"]),
+    "mp3": ("mp3", "audio/mpeg", ["-ar", "44100", "-ac", "1", "-c:a", "libmp3lame", "-b:a", "64k"]),
+    "m4a": ("m4a", "audio/mp4", ["-ar", "44100", "-ac", "1", "-c:a", "aac", "-b:a", "64k"]),
+}
+
+ENDPOINT = "/transcribe_and_reply/"
+
+
+def synthetic_speech(duration_s: float, rate: int = TARGET_RATE, seed: int = 0) -> np.ndarray:
+    """Speech-like test signal: voiced syllables at ~4 Hz separated by short pauses"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * rate)) / rate
+
+    # Pitch wanders between 100 and 220 Hz
+    f0 = 160 + 60 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, 2 * np.pi))
+    phase = 2 * np.pi * np.cumsum(f0) / rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+
+    # Syllables with a pause every couple of seconds
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+    pauses = (np.sin(2 * np.pi * 0.4 * t + rng.uniform(0, 2 * np.pi)) > -0.8).astype(np.float32)
+    signal = 0.25 * voiced * syllables * pauses + 0.002 * rng.standard_normal(len(t))
+    return np.clip(signal, -1, 1).astype(np.float32)
+
+
+def load_source(path: str, duration_s: float) -> np.ndarray:
+    """Loop or cut a real recording to the requested duration"""
+    with open(path, "rb") as f:
+        wav, _ = normalize_audio(f.read(), None)
+    samples = wav_to_float(wav)
+    needed = int(duration_s * TARGET_RATE)
+    return np.resize(samples, needed)
+
+
+def encode_clip(samples: np.ndarray, container: str, path: str):
+    """Write 16kHz float samples to path in the given container with ffmpeg"""
+    _, _, output_args = CONTAINERS[container]
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "s16le", "-ar", str(TARGET_RATE), "-ac", "1", "-i", "pipe:0",
+    ] + output_args + [path]
+    subprocess.run(command, input=pcm, check=True)
+
+
+def build_corpus(out_dir: str, durations: list, containers: list, source: Optional[str] = None) -> list:
+    """Write every duration x container combination; returns the clip records"""
+    os.makedirs(out_dir, exist_ok=True)
+    clips = []
+    for index, duration in enumerate(durations):
+        samples = load_source(source, duration) if source else synthetic_speech(duration, seed=index)
+        for container in containers:
+            extension, content_type, _ = CONTAINERS[container]
+            name = f"{container}_{duration:g}s.{extension}"
+            encode_clip(samples, container, os.path.join(out_dir, name))
+            clips.append({
+                "file": name,
+                "content_type": content_type,
+                "container": container,
+                "duration_s": duration,
+                "bytes": os.path.getsize(os.path.join(out_dir, name)),
+            })
+            print(f"  {name:<20} {clips[-1]['bytes']:>10} bytes")
+    return clips
+
+
+def write_request_log(path: str, clips: list, count: int, seed: int = 0):
+    """
+    A replayable request log. Clips are drawn at random, short ones more
+    often (weight 1/sqrt(duration)), the way interactive traffic skews.
+    """
+    rng = random.Random(seed)
+    weights = [1 / clip["duration_s"] ** 0.5 for clip in clips]
+    with open(path, "w") as f:
+        for clip in rng.choices(clips, weights=weights, k=count):
+            entry = {"endpoint": ENDPOINT, "file": clip["file"], "content_type": clip["content_type"]}
+            f.write(json.dumps(entry) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate reference clips and a request log for bench_load.py")
+    parser.add_argument("out_dir")
+    parser.add_argument("--durations", nargs="+", type=float, default=[2, 5, 15, 60], help="clip lengths in seconds")
+    parser.add_argument("--containers", nargs="+", default=list(CONTAINERS), choices=list(CONTAINERS))
+    parser.add_argument("--source", help="real recording to use instead of synthetic speech")
+    parser.add_argument("--requests", type=int, default=200, help="entries in the request log")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Writing clips to {args.out_dir}")
+    clips = build_corpus(args.out_dir, args.durations, args.containers, args.source)
+    with open(os.path.join(args.out_dir, "clips.json"), "w") as f:
+        json.dump(clips, f, indent=2)
+
+    log_path = os.path.join(args.out_dir, "requests.jsonl")
+    write_request_log(log_path, clips, args.requests, args.seed)
+    print(f"{len(clips)} clips, {args.requests} requests in {log_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+# bench_load.py
+"""
+Replay a request log against the service at a fixed concurrency and report
+latency percentiles, throughput, per-stage time and peak memory.
+
+    python bench_corpus.py bench_corpus/
+    python bench_load.py bench_corpus/requests.jsonl --launch --concurrency 16 --stub-latency-ms 300
+    python bench_load.py bench_corpus/requests.jsonl --url http://localhost:8080 --concurrency 16
+
+Each log line is {"endpoint": ..., "file": ..., "content_type": ...} with
+file relative to the log. With --launch, a stub UltraVox (stub_ultravox.py)
+and the service are started locally and the peak RSS of the service
+(including its audio worker processes) is sampled; the reply cache is off
+unless --cache is given, so every request does the full pipeline.
+
+Per-stage times come from the Server-Timing header when the service sends
+one, next to the client-side split into time to first byte and download.
+Pass --output to save the report and --baseline to fail (exit 1) when p95
+latency, throughput or peak RSS regress by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+import httpx
+
+
+class Result(NamedTuple):
+    file: str
+    status: int
+    latency_s: float
+    ttfb_s: float
+    response_bytes: int
+    stages: dict
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def parse_server_timing(header: Optional[str]) -> dict:
+    """'decode;dur=12.5, upstream;dur=300' -> {"decode": 12.5, "upstream": 300.0}"""
+    stages = {}
+    for metric in (header or "").split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if name and key == "dur":
+                try:
+                    stages[name] = float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+def load_log(path: str) -> list:
+    """Read the request log and the clip bytes it refers to (each file once)"""
+    base = os.path.dirname(os.path.abspath(path))
+    clips = {}
+    entries = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            name = entry["file"]
+            if name not in clips:
+                with open(os.path.join(base, name), "rb") as clip:
+                    clips[name] = clip.read()
+            entries.append((entry.get("endpoint", "/transcribe_and_reply/"), name,
+                            entry.get("content_type", "application/octet-stream"), clips[name]))
+    return entries
+
+
+async def send(client: httpx.AsyncClient, url: str, entry: tuple) -> Result:
+    endpoint, name, content_type, data = entry
+    started = time.perf_counter()
+    try:
+        async with client.stream("POST", url + endpoint, files={"file": (name, data, content_type)}) as response:
+            ttfb = time.perf_counter() - started
+            body = await response.aread()
+            status = response.status_code
+            stages = parse_server_timing(response.headers.get("Server-Timing"))
+    except httpx.HTTPError as e:
+        elapsed = time.perf_counter() - started
+        return Result(name, 0, elapsed, elapsed, 0, {"error": type(e).__name__})
+    return Result(name, status, time.perf_counter() - started, ttfb, len(body), stages)
+
+
+async def run_load(url: str, entries: list, concurrency: int, total: int, warmup: int, timeout: float) -> tuple:
+    """Closed-loop replay: `concurrency` workers cycle through the log until `total` requests finish"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        for i in range(warmup):
+            await send(client, url, entries[i % len(entries)])
+
+        results = []
+        next_index = 0
+
+        async def worker():
+            nonlocal next_index
+            while next_index < total:
+                index = next_index
+                next_index += 1
+                results.append(await send(client, url, entries[index % len(entries)]))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        service_stats = {}
+        for path in ("/upstream/stats", "/audio_pool/stats"):
+            try:
+                response = await client.get(url + path)
+                if response.status_code == 200:
+                    service_stats[path] = response.json()
+            except httpx.HTTPError:
+                pass
+    return results, elapsed, service_stats
+
+
+def process_tree(pid: int) -> list:
+    """pid and all of its descendants"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces; ppid follows its closing parenthesis
+                    parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    tree = [pid]
+    for member in tree:
+        tree.extend(child for child, parent in parents.items() if parent == member)
+    return tree
+
+
+def read_status_kb(pid: int, field: str) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Samples the combined RSS of a process tree in a background thread"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        return {
+            "peak_tree_rss_mb": round(self.peak_kb / 1024, 1),
+            # Kernel-tracked high-water mark of the main service process
+            "service_vmhwm_mb": round(read_status_kb(self.pid, "VmHWM") / 1024, 1),
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            total = sum(read_status_kb(pid, "VmRSS") for pid in process_tree(self.pid))
+            self.peak_kb = max(self.peak_kb, total)
+            self._stop.wait(self.interval)
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def launch(args) -> tuple:
+    """Start the stub UltraVox and the service; returns (service_url, processes)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    log = open(args.service_log or os.devnull, "ab")
+    stub_url = f"http://127.0.0.1:{args.stub_port}/"
+    stub = subprocess.Popen(
+        [sys.executable, "stub_ultravox.py", "serve", "--port", str(args.stub_port),
+         "--latency-ms", str(args.stub_latency_ms), "--jitter-ms", str(args.stub_jitter_ms),
+         "--per-audio-s-ms", str(args.stub_per_audio_s_ms), "--error-rate", str(args.stub_error_rate)],
+        cwd=here, stdout=log, stderr=subprocess.STDOUT,
+    )
+    processes = [stub]
+    try:
+        wait_until_up(stub_url + "stats", stub)
+
+        env = dict(os.environ, ULTRAVOX_URL=stub_url, ULTRAVOX_API_KEY=os.getenv("ULTRAVOX_API_KEY", "bench"))
+        if not args.cache:
+            env["REPLY_CACHE_MAX_BYTES"] = "0"
+            env.pop("REPLY_CACHE_DIR", None)
+        service = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=here, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        processes.append(service)
+        service_url = f"http://127.0.0.1:{args.port}"
+        wait_until_up(service_url + "/", service)
+    except Exception:
+        for process in processes:
+            process.terminate()
+        raise
+    return service_url, processes
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    ok = [r for r in results if r.status == 200]
+    latencies = [r.latency_s for r in ok]
+
+    stages = defaultdict(list)
+    for r in ok:
+        stages["client_ttfb"].append(1000 * r.ttfb_s)
+        stages["client_download"].append(1000 * (r.latency_s - r.ttfb_s))
+        for name, duration in r.stages.items():
+            stages[name].append(duration)
+
+    by_file = defaultdict(list)
+    for r in ok:
+        by_file[r.file].append(r.latency_s)
+
+    statuses = defaultdict(int)
+    for r in results:
+        statuses[str(r.status)] += 1
+
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "statuses": dict(statuses),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(1000 * percentile(latencies, 0.50), 1),
+            "p95": round(1000 * percentile(latencies, 0.95), 1),
+            "p99": round(1000 * percentile(latencies, 0.99), 1),
+            "max": round(1000 * max(latencies), 1) if latencies else 0.0,
+        },
+        "stages_ms": {
+            name: {"mean": round(sum(values) / len(values), 1), "p95": round(percentile(values, 0.95), 1)}
+            for name, values in stages.items()
+        },
+        "by_file_p50_ms": {
+            name: round(1000 * percentile(values, 0.50), 1) for name, values in sorted(by_file.items())
+        },
+    }
+
+
+def print_report(report: dict):
+    latency = report["latency_ms"]
+    print(f"\n{report['ok']}/{report['requests']} ok in {report['elapsed_s']}s "
+          f"({report['throughput_rps']} req/s), statuses {report['statuses']}")
+    print(f"latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    if "memory" in report:
+        print(f"memory MB   peak tree RSS {report['memory']['peak_tree_rss_mb']}  "
+              f"service VmHWM {report['memory']['service_vmhwm_mb']}")
+
+    print(f"\n{'stage':<20} {'mean ms':>9} {'p95 ms':>9}")
+    for name, values in report["stages_ms"].items():
+        print(f"{name:<20} {values['mean']:>9} {values['p95']:>9}")
+
+    print(f"\n{'clip':<24} {'p50 ms':>9}")
+    for name, value in report["by_file_p50_ms"].items():
+        print(f"{name:<24} {value:>9}")
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that got worse than the baseline by more than tolerance"""
+    checks = [
+        ("p95 latency", report["latency_ms"]["p95"], baseline["latency_ms"]["p95"], True),
+        ("throughput", report["throughput_rps"], baseline["throughput_rps"], False),
+    ]
+    if "memory" in report and "memory" in baseline:
+        checks.append(("peak RSS", report["memory"]["peak_tree_rss_mb"], baseline["memory"]["peak_tree_rss_mb"], True))
+
+    failed = []
+    for name, value, reference, lower_is_better in checks:
+        if not reference:
+            continue
+        change = (value - reference) / reference
+        if (change if lower_is_better else -change) > tolerance:
+            failed.append(f"{name}: {reference} -> {value} ({change:+.0%})")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a request log against the service under load")
+    parser.add_argument("log", help="JSONL request log, e.g. from bench_corpus.py")
+    parser.add_argument("--url", help="running service to target")
+    parser.add_argument("--launch", action="store_true", help="start a stub UltraVox and the service locally")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=None, help="requests to send (default: one pass over the log)")
+    parser.add_argument("--warmup", type=int, default=4, help="unrecorded requests sent first")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=8765, help="service port with --launch")
+    parser.add_argument("--stub-port", type=int, default=8766)
+    parser.add_argument("--stub-latency-ms", type=float, default=0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=0)
+    parser.add_argument("--stub-per-audio-s-ms", type=float, default=0)
+    parser.add_argument("--stub-error-rate", type=float, default=0)
+    parser.add_argument("--cache", action="store_true", help="keep the reply cache enabled with --launch")
+    parser.add_argument("--service-log", help="file for the output of launched processes (default: discarded)")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="earlier --output report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+    if bool(args.url) == args.launch:
+        parser.error("give exactly one of --url or --launch")
+
+    entries = load_log(args.log)
+    if not entries:
+        parser.error(f"{args.log} has no requests")
+    total = args.requests or len(entries)
+
+    processes = []
+    sampler = None
+    url = args.url.rstrip("/") if args.url else None
+    try:
+        if args.launch:
+            url, processes = launch(args)
+            sampler = RssSampler(processes[-1].pid)
+            sampler.start()
+
+        print(f"Sending {total} requests to {url} at concurrency {args.concurrency}")
+        results, elapsed, service_stats = asyncio.run(
+            run_load(url, entries, args.concurrency, total, args.warmup, args.timeout)
+        )
+        report = summarize(results, elapsed)
+        if sampler is not None:
+            report["memory"] = sampler.stop()
+        report["service"] = service_stats
+        report["config"] = {k: v for k, v in vars(args).items() if k not in ("baseline", "output")}
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed = regressions(report, json.load(f), args.tolerance)
+        if failed:
+            print("\nRegressions beyond tolerance:")
+            for line in failed:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# compare_whisper_modes.py
+"""
+Compare Whisper inference modes on a set of reference clips.
+
+Each clip is a WAV/webm/... file; a .txt file with the same stem holds its
+reference transcript. Clips without one are scored against the output of the
+first mode listed, so the default run reports how far int8 drifts from float32.
+
+    python compare_whisper_modes.py clips/ --models large-v3 small --dtypes float32 int8 --threads 4
+"""
+import argparse
+import glob
+import os
+import re
+import statistics
+import time
+
+from audio_processing import TARGET_RATE, normalize_audio, wav_to_float
+from whisper_registry import CHECKPOINTS, DTYPES, ModelRegistry
+
+
+def normalize_text(text: str) -> list:
+    """Lowercase, strip punctuation and split into words"""
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length"""
+    ref, hyp = normalize_text(reference), normalize_text(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            ))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def load_clips(directory: str) -> list:
+    """Return (name, samples, duration_s, reference_or_None) for each clip"""
+    clips = []
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        if path.endswith(".txt") or os.path.isdir(path):
+            continue
+        with open(path, "rb") as f:
+            wav, _ = normalize_audio(f.read(), None)
+        samples = wav_to_float(wav)
+
+        reference = None
+        transcript = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(transcript):
+            with open(transcript) as f:
+                reference = f.read().strip()
+
+        clips.append((os.path.basename(path), samples, len(samples) / TARGET_RATE, reference))
+    return clips
+
+
+def run_mode(registry: ModelRegistry, model_id: str, dtype: str, clips: list) -> dict:
+    """Transcribe every clip with one model/dtype and collect latency figures"""
+    report = dict(registry.warm_up(model_id, "cpu", dtype))
+    pipe = registry.get(model_id, "cpu", dtype)
+
+    latencies, texts = [], []
+    for _, samples, _, _ in clips:
+        started = time.perf_counter()
+        result = pipe({"raw": samples, "sampling_rate": TARGET_RATE})
+        latencies.append(time.perf_counter() - started)
+        texts.append(result["text"].strip())
+
+    audio_seconds = sum(duration for _, _, duration, _ in clips)
+    report.update(
+        latency_mean_s=statistics.mean(latencies),
+        latency_p95_s=sorted(latencies)[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        real_time_factor=sum(latencies) / audio_seconds if audio_seconds else 0.0,
+        texts=texts,
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Whisper accuracy and latency across inference modes")
+    parser.add_argument("clips", help="directory of audio clips with optional .txt references")
+    parser.add_argument("--models", nargs="+", default=["large-v3"],
+                        help=f"checkpoints or short names ({', '.join(CHECKPOINTS)})")
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "int8"], choices=[d for d in DTYPES if d != "float16"])
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips)
+    if not clips:
+        parser.error(f"No clips found in {args.clips}")
+    print(f"{len(clips)} clips, {sum(c[2] for c in clips):.1f}s of audio")
+
+    registry = ModelRegistry(num_threads=args.threads)
+    results = []
+    for model_id in args.models:
+        for dtype in args.dtypes:
+            print(f"Running {model_id} ({dtype})...")
+            results.append(run_mode(registry, model_id, dtype, clips))
+
+    # Clips without a reference are scored against the first mode's output
+    baseline = results[0]["texts"]
+    print()
+    print(f"{'model':<40} {'dtype':<8} {'load s':>7} {'weights MB':>10} {'mean s':>7} {'p95 s':>7} {'RTF':>6} {'WER':>6}")
+    for result in results:
+        errors = [
+            word_error_rate(reference if reference is not None else baseline[i], text)
+            for i, ((_, _, _, reference), text) in enumerate(zip(clips, result["texts"]))
+        ]
+        print(
+            f"{result['model_id']:<40} {result['dtype']:<8} {result['load_seconds']:>7.1f} "
+            f"{result['parameter_bytes'] / 2**20:>10.0f} {result['latency_mean_s']:>7.2f} "
+            f"{result['latency_p95_s']:>7.2f} {result['real_time_factor']:>6.2f} {statistics.mean(errors):>6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# conversation.py
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Optional
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from audio_processing import (
+    MAX_SAMPLE_RATE, MIN_SAMPLE_RATE, TARGET_RATE, TARGET_SAMPLE_WIDTH, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM,
+    AudioProcessingError,
+)
+from audio_stream import AudioFieldExtractor, FfmpegTranscoder, StreamingNormalizer, ultravox_request_body
+from ultravox_client import UltraVoxClient, redact_error_body
+
+logger = logging.getLogger(__name__)
+
+# Raw frame encodings: (WAV format tag, bytes per sample)
+PCM_ENCODINGS = {
+    "pcm_s16le": (WAVE_FORMAT_PCM, 2),
+    "pcm_f32le": (WAVE_FORMAT_IEEE_FLOAT, 4),
+}
+
+# Compressed frames from a browser MediaRecorder (webm or ogg container)
+OPUS_ENCODING = "opus"
+
+# Accepted ranges for the raw PCM format in a start message
+SAMPLE_RATE_RANGE = (MIN_SAMPLE_RATE, MAX_SAMPLE_RATE)
+CHANNELS_RANGE = (1, 8)
+
+# Per-session limits: longest utterance kept, compressed frames buffered ahead
+# of ffmpeg, and finished utterances waiting for their reply
+MAX_UTTERANCE_S = 60
+MAX_UTTERANCE_BYTES = MAX_UTTERANCE_S * TARGET_RATE * TARGET_SAMPLE_WIDTH
+MAX_QUEUED_FRAMES = 64
+MAX_PENDING_REPLIES = 4
+
+
+def _int_in_range(value, bounds: tuple) -> Optional[int]:
+    """value as an int if it is one within bounds, else None"""
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    low, high = bounds
+    return value if low <= value <= high else None
+
+
+class UtteranceDecoder:
+    """
+    Converts the frames of one utterance to 16kHz mono PCM16 while they arrive,
+    so only the resampler tail is left to do when the utterance ends.
+
+    Raw PCM frames are resampled in-process. Opus frames must form one
+    self-contained webm/ogg stream per utterance (restart the MediaRecorder
+    between utterances) and are decoded by an ffmpeg process fed live.
+    """
+
+    def __init__(self, encoding: str, sample_rate: int, channels: int):
+        self._pcm = bytearray()
+        self._frames: Optional[asyncio.Queue] = None
+        self._decoder_task: Optional[asyncio.Task] = None
+
+        if encoding == OPUS_ENCODING:
+            self._normalizer = StreamingNormalizer()
+            # Bounded so a client outrunning ffmpeg is slowed down instead of buffered
+            self._frames = asyncio.Queue(maxsize=MAX_QUEUED_FRAMES)
+            self._decoder_task = asyncio.create_task(self._decode_compressed())
+        elif encoding in PCM_ENCODINGS:
+            format_tag, sample_width = PCM_ENCODINGS[encoding]
+            self._normalizer = StreamingNormalizer.for_raw_pcm(format_tag, sample_width, sample_rate, channels)
+        else:
+            raise AudioProcessingError(f"Unsupported encoding: {encoding}")
+
+    async def feed(self, frame: bytes):
+        if self._frames is not None:
+            await self._put(frame)
+        else:
+            self._append(self._normalizer.feed(frame))
+
+    async def finish(self) -> bytes:
+        """Complete the utterance and return its normalized PCM16"""
+        if self._frames is not None:
+            await self._put(None)
+            await self._decoder_task
+        self._append(self._normalizer.finish())
+        return bytes(self._pcm)
+
+    def _append(self, pcm: bytes):
+        self._pcm += pcm
+        if len(self._pcm) > MAX_UTTERANCE_BYTES:
+            raise AudioProcessingError(f"Utterance longer than {MAX_UTTERANCE_S}s")
+
+    async def _put(self, frame: Optional[bytes]):
+        """Queue a frame for the decoder, surfacing its error if it has stopped"""
+        put = asyncio.ensure_future(self._frames.put(frame))
+        await asyncio.wait({put, self._decoder_task}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            # Raises the decoder's error; a decoder that finished cleanly ignores the rest
+            self._decoder_task.result()
+
+    def abort(self):
+        if self._decoder_task is not None:
+            self._decoder_task.cancel()
+
+    async def _queued_frames(self) -> AsyncIterator[bytes]:
+        while True:
+            frame = await self._frames.get()
+            if frame is None:
+                return
+            yield frame
+
+    async def _decode_compressed(self):
+        async for chunk in FfmpegTranscoder(self._queued_frames()):
+            self._append(self._normalizer.feed(chunk))
+
+
+class ConversationSession:
+    """
+    One real-time conversation over a WebSocket.
+
+    Protocol (text messages are JSON):
+      -> {"type": "start", "encoding": "pcm_s16le" | "pcm_f32le" | "opus",
+          "sample_rate": 48000, "channels": 1}
+      -> binary audio frames
+      -> {"type": "end_utterance"}
+      <- {"type": "reply_start"}, binary reply WAV chunks,
+         {"type": "reply_end", "first_audio_ms": ...}
+      <- {"type": "error", "details": ...}
+      -> {"type": "stop"}
+
+    Frames for the next utterance may be sent while a reply is streaming;
+    replies are sent in utterance order. An utterance longer than
+    MAX_UTTERANCE_S, or ending while MAX_PENDING_REPLIES replies are still
+    pending, is answered with an error and dropped.
+    """
+
+    def __init__(self, websocket: WebSocket, client: UltraVoxClient, prompt: str, model: str):
+        self.websocket = websocket
+        self.client = client
+        self.prompt = prompt
+        self.model = model
+
+        self._encoding = "pcm_s16le"
+        self._sample_rate = 16000
+        self._channels = 1
+        self._utterance: Optional[UtteranceDecoder] = None
+        # Set after an utterance failed, so its remaining frames are dropped up to end_utterance
+        self._discarding = False
+        self._reply_task: Optional[asyncio.Task] = None
+        self._pending_replies = 0
+        self._send_lock = asyncio.Lock()
+
+    async def run(self):
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    await self._on_frame(message["bytes"])
+                elif message.get("text") is not None:
+                    if not await self._on_control(message["text"]):
+                        break
+            if self._reply_task is not None:
+                await asyncio.gather(self._reply_task, return_exceptions=True)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if self._utterance is not None:
+                self._utterance.abort()
+            if self._reply_task is not None and not self._reply_task.done():
+                self._reply_task.cancel()
+
+    async def _on_control(self, text: str) -> bool:
+        """Handle a control message; returns False when the session should end"""
+        try:
+            message = json.loads(text)
+        except ValueError:
+            await self._send_json({"type": "error", "details": "Control messages must be JSON"})
+            return True
+
+        if not isinstance(message, dict):
+            await self._send_json({"type": "error", "details": "Control messages must be JSON objects"})
+            return True
+
+        kind = message.get("type")
+        if kind == "start":
+            self._discarding = False
+            await self._on_start(message)
+        elif kind == "end_utterance":
+            await self._end_utterance()
+        elif kind == "stop":
+            return False
+        else:
+            await self._send_json({"type": "error", "details": f"Unknown message type: {kind}"})
+        return True
+
+    async def _on_start(self, message: dict):
+        """Apply a start message's audio format; an invalid one is rejected as a whole"""
+        encoding = message.get("encoding", self._encoding)
+        sample_rate = _int_in_range(message.get("sample_rate", self._sample_rate), SAMPLE_RATE_RANGE)
+        channels = _int_in_range(message.get("channels", self._channels), CHANNELS_RANGE)
+        if not isinstance(encoding, str) or (encoding not in PCM_ENCODINGS and encoding != OPUS_ENCODING):
+            details = f"Unsupported encoding: {encoding}"
+        elif sample_rate is None:
+            details = f"sample_rate must be an integer from {SAMPLE_RATE_RANGE[0]} to {SAMPLE_RATE_RANGE[1]}"
+        elif channels is None:
+            details = f"channels must be an integer from {CHANNELS_RANGE[0]} to {CHANNELS_RANGE[1]}"
+        else:
+            self._encoding, self._sample_rate, self._channels = encoding, sample_rate, channels
+            return
+        await self._send_json({"type": "error", "details": details})
+
+    async def _on_frame(self, frame: bytes):
+        if self._discarding:
+            return
+        try:
+            if self._utterance is None:
+                self._utterance = UtteranceDecoder(self._encoding, self._sample_rate, self._channels)
+            await self._utterance.feed(frame)
+        except AudioProcessingError as e:
+            if self._utterance is not None:
+                self._utterance.abort()
+                self._utterance = None
+            self._discarding = True
+            await self._send_json({"type": "error", "details": str(e)})
+
+    async def _end_utterance(self):
+        utterance, self._utterance = self._utterance, None
+        if self._discarding:
+            self._discarding = False
+            return
+        if utterance is None:
+            return
+        if self._pending_replies >= MAX_PENDING_REPLIES:
+            utterance.abort()
+            details = f"More than {MAX_PENDING_REPLIES} replies pending, utterance dropped"
+            await self._send_json({"type": "error", "details": details})
+            return
+        ended = time.perf_counter()
+        try:
+            pcm = await utterance.finish()
+        except AudioProcessingError as e:
+            await self._send_json({"type": "error", "details": str(e)})
+            return
+        if not pcm:
+            return
+
+        # Chain replies so they go out in utterance order
+        previous = self._reply_task
+        self._pending_replies += 1
+        self._reply_task = asyncio.create_task(self._reply(previous, pcm, ended))
+        self._reply_task.add_done_callback(self._reply_finished)
+
+    def _reply_finished(self, task: asyncio.Task):
+        self._pending_replies -= 1
+
+    async def _reply(self, previous: Optional[asyncio.Task], pcm: bytes, ended: float):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+
+        async def audio() -> AsyncIterator[bytes]:
+            yield pcm
+
+        body = ultravox_request_body(audio(), self.prompt, self.model, data_size=len(pcm))
+        try:
+            async with self.client.stream_post(body) as upstream:
+                if upstream.status_code != 200:
+                    detail = redact_error_body(await upstream.aread())
+                    logger.error(f"UltraVox API error text: {detail}")
+                    await self._send_json({"type": "error", "details": f"UltraVox API error: {detail}"})
+                    return
+
+                await self._send_json({"type": "reply_start"})
+                extractor = AudioFieldExtractor()
+                first_audio_ms = None
+                async for chunk in upstream.aiter_bytes():
+                    audio_bytes = extractor.feed(chunk)
+                    if audio_bytes:
+                        if first_audio_ms is None:
+                            first_audio_ms = round(1000 * (time.perf_counter() - ended))
+                        await self._send_bytes(audio_bytes)
+                if not extractor.found:
+                    await self._send_json({"type": "error", "details": "No audio in UltraVox response"})
+                await self._send_json({"type": "reply_end", "first_audio_ms": first_audio_ms})
+
+        except Exception as e:
+            logger.error(f"Conversation reply failed: {str(e)}", exc_info=True)
+            await self._send_json({"type": "error", "details": str(e)})
+
+    async def _send_json(self, message: dict):
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(message))
+
+    async def _send_bytes(self, data: bytes):
+        async with self._send_lock:
+            await self.websocket.send_bytes(data)
@@ -1,4 +1,21 @@
+import argparse
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Record, transcribe and speak back")
+    parser.add_argument("--continuous", action="store_true",
+                        help="Listen continuously and reply to each utterance (see voice_loop.py)")
+    args = parser.parse_args()
+    if args.continuous:
+        from voice_loop import run_voice_loop
+        run_voice_loop()
+        return
+
+    # Imported here so the module loads (e.g. under pytest collection) without audio devices
+    from record_input import record_audio
+    from response import speak_text
+    from transcribe_input import transcribe_audio
+
     # Record audio
     audio_file = "input_audio.wav"
     record_audio(audio_file, duration=5)
@@ -0,0 +1,150 @@
+# metrics.py
+import contextlib
+import contextvars
+import time
+from typing import Callable, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+# Stage times range from sub-millisecond header parsing to multi-second upstream calls
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram(
+    "ultravox_stage_seconds", "Time spent in each stage of a request", ["endpoint", "stage"], buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "ultravox_request_seconds", "Time from request start to response start", ["endpoint", "status"],
+    buckets=STAGE_BUCKETS,
+)
+IN_FLIGHT = Gauge("ultravox_requests_in_flight", "Requests currently being handled", ["endpoint"])
+QUEUE_DEPTH = Gauge("ultravox_queue_depth", "Jobs waiting in each internal queue", ["queue"])
+BUSY = Gauge("ultravox_busy", "Jobs currently running in each internal stage", ["stage"])
+
+# Timer of the request being handled, so helpers can record stages without it being passed around
+_current_timer: contextvars.ContextVar = contextvars.ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    Per-request stage timings.
+
+    Stages are recorded with stage() or add(); repeated stages accumulate.
+    observe() publishes them to the stage histogram and server_timing()
+    renders them as a Server-Timing header value.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def activate(self) -> "StageTimer":
+        """Make this the timer that record_stage() and timed_stage() write to"""
+        _current_timer.set(self)
+        return self
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def observe(self):
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.labels(self.endpoint, name).observe(seconds)
+
+    def server_timing(self) -> str:
+        metrics = [f"{name};dur={1000 * seconds:.1f}" for name, seconds in self.stages.items()]
+        metrics.append(f"total;dur={1000 * (time.perf_counter() - self.started):.1f}")
+        return ", ".join(metrics)
+
+
+def record_stage(name: str, seconds: float):
+    """Add time to a stage of the current request, if one is being timed"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+@contextlib.contextmanager
+def timed_stage(name: str):
+    """Time a block as a stage of the current request, if one is being timed"""
+    timer: Optional[StageTimer] = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def track_queue(name: str, depth: Callable[[], float]):
+    """Export a queue depth, read at scrape time"""
+    QUEUE_DEPTH.labels(name).set_function(depth)
+
+
+def track_busy(name: str, busy: Callable[[], float]):
+    """Export an in-progress count, read at scrape time"""
+    BUSY.labels(name).set_function(busy)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting in-flight requests and WebSocket sessions per
+    endpoint and timing HTTP requests up to the start of the response.
+    Requests are labelled with the route template (/jobs/{job_id}); paths
+    that match no route are grouped as "other" to bound label cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _endpoint(scope) -> str:
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        in_flight = IN_FLIGHT.labels(endpoint)
+        in_flight.inc()
+        if scope["type"] == "websocket":
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                in_flight.dec()
+            return
+
+        started = time.perf_counter()
+        responded = False
+
+        async def send_and_time(message):
+            nonlocal responded
+            if message["type"] == "http.response.start" and not responded:
+                responded = True
+                REQUEST_SECONDS.labels(endpoint, str(message["status"])).observe(time.perf_counter() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_time)
+        finally:
+            in_flight.dec()
+            if not responded:
+                REQUEST_SECONDS.labels(endpoint, "500").observe(time.perf_counter() - started)
+
+
+def render() -> tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, with its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,188 @@
+# reply_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry(NamedTuple):
+    audio: bytes
+    info: dict
+    expires_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.audio)
+
+
+class ReplyCache:
+    """
+    Content-addressed cache for UltraVox replies.
+
+    Entries are keyed on a hash of the normalized PCM, the prompt and the
+    model. A memory LRU tier is bounded by total audio bytes and a TTL; an
+    optional disk tier keeps replies across restarts. Concurrent requests
+    for the same key share a single upstream call.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    @staticmethod
+    def make_key(pcm: bytes, prompt: str, model: str) -> str:
+        """Hash the normalized PCM together with the prompt and model"""
+        digest = hashlib.sha256()
+        for part in (model.encode("utf-8"), prompt.encode("utf-8")):
+            # Length-prefix the text parts so field boundaries are unambiguous
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        digest.update(pcm)
+        return digest.hexdigest()
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[tuple[bytes, dict]]]) -> tuple[bytes, dict]:
+        """
+        Return the cached (audio, info) for key, or run compute() once and cache it.
+        Errors from compute() are propagated to every waiter and never cached.
+        """
+        entry = self._get_memory(key)
+        if entry is not None:
+            self._counters["memory_hits"] += 1
+            return entry.audio, entry.info
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._counters["coalesced"] += 1
+        else:
+            # Run the fill in its own task so a cancelled caller does not
+            # cancel the upstream call other waiters are sharing
+            task = asyncio.ensure_future(self._fill(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._fill_done(key, done))
+        return await asyncio.shield(task)
+
+    async def _fill(self, key: str, compute: Callable[[], Awaitable[tuple[bytes, dict]]]) -> tuple[bytes, dict]:
+        entry = await self._get_disk(key) if self.disk_dir else None
+        if entry is not None:
+            self._counters["disk_hits"] += 1
+        else:
+            self._counters["misses"] += 1
+            audio, info = await compute()
+            entry = CacheEntry(audio, info, time.time() + self.ttl)
+            if self.disk_dir:
+                await asyncio.to_thread(self._write_disk, key, entry)
+        self._put_memory(key, entry)
+        return entry.audio, entry.info
+
+    def _fill_done(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Retrieve the exception so a fill nobody awaited is not logged as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    def _get_memory(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._remove(key)
+            self._counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put_memory(self, key: str, entry: CacheEntry):
+        if entry.size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _disk_paths(self, key: str) -> tuple[str, str]:
+        directory = os.path.join(self.disk_dir, key[:2])
+        return os.path.join(directory, f"{key}.wav"), os.path.join(directory, f"{key}.json")
+
+    async def _get_disk(self, key: str) -> Optional[CacheEntry]:
+        return await asyncio.to_thread(self._read_disk, key)
+
+    def _read_disk(self, key: str) -> Optional[CacheEntry]:
+        audio_path, meta_path = self._disk_paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["expires_at"] <= time.time():
+                self._counters["expirations"] += 1
+                for path in (audio_path, meta_path):
+                    os.remove(path)
+                return None
+            with open(audio_path, "rb") as f:
+                audio = f.read()
+            return CacheEntry(audio, meta["info"], meta["expires_at"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, entry: CacheEntry):
+        audio_path, meta_path = self._disk_paths(key)
+        try:
+            os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+            # Write to temp files and rename so readers never see partial entries;
+            # the metadata goes last as it marks the entry complete
+            for path, data, mode in (
+                (audio_path, entry.audio, "wb"),
+                (meta_path, json.dumps({"info": entry.info, "expires_at": entry.expires_at}), "w"),
+            ):
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, mode) as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and current memory usage"""
+        lookups = self._counters["memory_hits"] + self._counters["disk_hits"] + self._counters["misses"]
+        hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+        return {
+            **self._counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "disk_dir": self.disk_dir,
+            "inflight": len(self._inflight),
+        }
@@ -1,6 +1,79 @@
+import logging
+import queue
+import threading
+
 import pyttsx3
 
+logger = logging.getLogger(__name__)
+
+
+class _Utterance:
+    def __init__(self, text, on_start):
+        self.text = text
+        self.on_start = on_start
+        self.done = threading.Event()
+        self.error = None
+
+
+class Speaker:
+    """
+    A single pyttsx3 engine on its own thread. Creating an engine is slow and
+    engines must be driven from the thread that created them, so every reply
+    is queued to this one. `speaking` is set while audio is being played.
+    """
+
+    def __init__(self):
+        self.speaking = threading.Event()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        engine = None
+        while True:
+            utterance = self._queue.get()
+            if utterance is None:
+                break
+            try:
+                if engine is None:
+                    engine = pyttsx3.init()
+                self.speaking.set()
+                if utterance.on_start is not None:
+                    utterance.on_start()
+                engine.say(utterance.text)
+                engine.runAndWait()
+            except Exception as e:
+                # Keep serving later replies, with a fresh engine in case this one is broken
+                logger.error(f"Speech failed: {str(e)}", exc_info=True)
+                utterance.error = e
+                engine = None
+            finally:
+                self.speaking.clear()
+                utterance.done.set()
+
+    def speak(self, text, wait=False, on_start=None):
+        """Queue text to be spoken; with wait, block until it has been said and raise any error"""
+        utterance = _Utterance(text, on_start)
+        self._queue.put(utterance)
+        if wait:
+            utterance.done.wait()
+            if utterance.error is not None:
+                raise utterance.error
+        return utterance.done
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+_speaker = None
+_speaker_lock = threading.Lock()
+
+
 def speak_text(text):
-    engine = pyttsx3.init()
-    engine.say(text)
-    engine.runAndWait()
+    """Speak text with the shared engine, returning when it has been said"""
+    global _speaker
+    with _speaker_lock:
+        if _speaker is None:
+            _speaker = Speaker()
+    _speaker.speak(text, wait=True)
@@ -1,8 +1,10 @@
+import argparse
+
 import sounddevice as sd
 from scipy.io.wavfile import write
-from transformers import pipeline, AutoProcessor, AutoModelForSpeechSeq2Seq
-import torch
-import pyttsx3
+
+from response import speak_text
+from transcribe_input import transcribe_audio
 
 
 # Record audio
@@ -14,39 +16,17 @@ def record_audio(filename, duration=5, samplerate=16000):
     print("Recording complete.")
 
 
-# Transcribe audio
-def transcribe_audio(filename):
-    device = "cuda:0" if torch.cuda.is_available() else "cpu"
-    model_id = "openai/whisper-large-v3"
-
-    model = AutoModelForSpeechSeq2Seq.from_pretrained(
-        model_id,
-        torch_dtype=torch.float16 if device == "cuda:0" else torch.float32
-    ).to(device)
-
-    processor = AutoProcessor.from_pretrained(model_id)
-
-    pipe = pipeline(
-        "automatic-speech-recognition",
-        model=model,
-        tokenizer=processor.tokenizer,
-        feature_extractor=processor.feature_extractor,
-        device=device,
-    )
-
-    result = pipe(filename)
-    return result["text"]
-
-
-# Generate voice response
-def speak_text(text):
-    engine = pyttsx3.init()
-    engine.say(text)
-    engine.runAndWait()
-
-
 # Main function
 def main():
+    parser = argparse.ArgumentParser(description="Record, transcribe and speak back")
+    parser.add_argument("--continuous", action="store_true",
+                        help="Listen continuously and reply to each utterance (see voice_loop.py)")
+    args = parser.parse_args()
+    if args.continuous:
+        from voice_loop import run_voice_loop
+        run_voice_loop()
+        return
+
     audio_file = "input_audio.wav"
 
     # Record audio
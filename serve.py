@@ -1,13 +1,12 @@
-import http.server
-import socketserver
+import logging
+import os
 
-PORT = 8080
-DIRECTORY = "fe"
+from static_assets import AssetIndex, serve
 
-class Handler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=DIRECTORY, **kwargs)
+PORT = int(os.getenv("PORT", 8080))
+DIRECTORY = os.getenv("FRONTEND_DIR", "fe")
 
-with socketserver.TCPServer(("", PORT), Handler) as httpd:
-    print(f"Serving at port {PORT}")
-    httpd.serve_forever()
+if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    # Precompresses and fingerprints the front end once, then serves it concurrently
+    serve(AssetIndex(DIRECTORY, os.getenv("FRONTEND_CACHE_DIR")), PORT)
@@ -0,0 +1,315 @@
+# static_assets.py
+"""
+Production serving of the static front end.
+
+At startup every file under the root is hashed for a strong ETag and, when
+compressible, gzip (and brotli, if the brotli package is installed)
+variants are built into a content-addressed cache directory, so restarts
+only compress files that changed. Requests get the best variant the client
+accepts, 304 when If-None-Match matches, and year-long immutable caching
+for fingerprinted file names (app.3f2a9c1b.js, index-B2xD9fK1.css); other
+files are revalidated on every use.
+
+Two ways to serve an AssetIndex:
+
+- serve(): a standalone ThreadingHTTPServer that writes bodies with
+  socket.sendfile (zero-copy), one thread per connection
+- StaticAssetsApp: an ASGI app to mount into FastAPI
+"""
+import email.utils
+import gzip
+import hashlib
+import http.server
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import urllib.parse
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred encodings, best first
+ENCODINGS = ("br", "gzip")
+ENCODING_SUFFIX = {"br": ".br", "gzip": ".gz"}
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json", "application/xml",
+    "image/svg+xml", "application/wasm", "application/manifest+json",
+)
+# Below this, compression overhead outweighs the saving
+MIN_COMPRESS_SIZE = 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# A fingerprint segment before the extension: hex (webpack) or base64url (Vite/esbuild)
+FINGERPRINT = re.compile(r"[.-]([0-9A-Za-z_]{8,})\.[0-9A-Za-z]+$")
+HEX_TOKEN = re.compile(r"[0-9a-fA-F]{8,}")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def is_fingerprinted(name: str) -> bool:
+    """Whether a file name carries a content hash, so its content can never change"""
+    match = FINGERPRINT.search(name)
+    if not match:
+        return False
+    token = match.group(1)
+    # Hex digests, or base64url hashes (which practically always contain a digit);
+    # words like "homepage" or "SemiBold" are not hashes
+    return HEX_TOKEN.fullmatch(token) is not None or any(c.isdigit() for c in token)
+
+
+def parse_accept_encoding(header: Optional[str]) -> set:
+    """Encodings the client accepts (q > 0)"""
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so a W/ prefix is ignored"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class Variant(NamedTuple):
+    path: str
+    size: int
+    etag: str
+    encoding: Optional[str]
+
+
+class Asset(NamedTuple):
+    content_type: str
+    cache_control: str
+    last_modified: str
+    # Encoding (None for identity) -> Variant
+    variants: dict
+
+
+class AssetIndex:
+    """
+    Every file under root with its precompressed variants. Built once; the
+    front end is expected not to change while it is served.
+    """
+
+    def __init__(self, root: str, cache_dir: Optional[str] = None, spa_fallback: bool = False):
+        self.root = os.path.abspath(root)
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "static-assets-cache")
+        self.spa_fallback = spa_fallback
+        self.assets = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._build()
+
+    def _build(self):
+        original_bytes = compressed_bytes = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                # Precompressed siblings from the front-end build are picked up with their source file
+                if name.endswith((".gz", ".br")) and os.path.exists(path[:-3]):
+                    continue
+                relative = os.path.relpath(path, self.root).replace(os.sep, "/")
+                self.assets["/" + relative] = asset = self._index_file(path, name)
+                identity = asset.variants[None]
+                smallest = min(v.size for v in asset.variants.values())
+                original_bytes += identity.size
+                compressed_bytes += smallest
+        logger.info(
+            f"Indexed {len(self.assets)} static assets from {self.root}: "
+            f"{original_bytes} bytes, {compressed_bytes} with the best encodings"
+        )
+
+    def _index_file(self, path: str, name: str) -> Asset:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()[:32]
+        stat = os.stat(path)
+
+        content_type, _ = mimetypes.guess_type(name)
+        content_type = content_type or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+
+        variants = {None: Variant(path, stat.st_size, f'"{content_hash}"', None)}
+        if stat.st_size >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODINGS:
+                variant = self._compressed(path, content_hash, encoding)
+                if variant is not None and variant.size < stat.st_size:
+                    variants[encoding] = variant
+
+        return Asset(
+            content_type=content_type,
+            cache_control=IMMUTABLE_CACHE_CONTROL if is_fingerprinted(name) else REVALIDATE_CACHE_CONTROL,
+            last_modified=email.utils.formatdate(stat.st_mtime, usegmt=True),
+            variants=variants,
+        )
+
+    def _compressed(self, path: str, content_hash: str, encoding: str) -> Optional[Variant]:
+        """A compressed variant: the build's own sibling file, or one cached by content hash"""
+        suffix = ENCODING_SUFFIX[encoding]
+        etag = f'"{content_hash}-{encoding}"'
+        if os.path.exists(path + suffix):
+            return Variant(path + suffix, os.path.getsize(path + suffix), etag, encoding)
+
+        cached = os.path.join(self.cache_dir, content_hash + suffix)
+        if not os.path.exists(cached):
+            if encoding == "br" and brotli is None:
+                return None
+            temp_path = f"{cached}.{os.getpid()}.tmp"
+            with open(path, "rb") as source, open(temp_path, "wb") as target:
+                if encoding == "gzip":
+                    # mtime=0 keeps the output, and so the cache, deterministic
+                    with gzip.GzipFile(fileobj=target, mode="wb", compresslevel=9, mtime=0) as compressed:
+                        shutil.copyfileobj(source, compressed)
+                else:
+                    target.write(brotli.compress(source.read(), quality=11))
+            os.replace(temp_path, cached)
+        return Variant(cached, os.path.getsize(cached), etag, encoding)
+
+    def lookup(self, url_path: str) -> Optional[Asset]:
+        path = url_path.split("?", 1)[0]
+        if path.endswith("/"):
+            path += "index.html"
+        asset = self.assets.get(path) or self.assets.get(path + "/index.html")
+        if asset is None and self.spa_fallback and "." not in path.rsplit("/", 1)[-1]:
+            # Client-side routes of a single-page app get the app shell
+            asset = self.assets.get("/index.html")
+        return asset
+
+    def resolve(self, url_path: str, accept_encoding: Optional[str], if_none_match: Optional[str]) -> tuple:
+        """
+        Decide the response for a GET/HEAD request.
+        Returns (status, headers, variant); variant is None when there is no body.
+        """
+        asset = self.lookup(url_path)
+        if asset is None:
+            return 404, {"Content-Type": "text/plain; charset=utf-8", "Content-Length": "9"}, None
+
+        accepted = parse_accept_encoding(accept_encoding)
+        variant = next(
+            (asset.variants[e] for e in ENCODINGS if e in asset.variants and e in accepted),
+            asset.variants[None],
+        )
+        headers = {
+            "ETag": variant.etag,
+            "Cache-Control": asset.cache_control,
+            "Last-Modified": asset.last_modified,
+        }
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(if_none_match, variant.etag):
+            return 304, headers, None
+
+        headers["Content-Type"] = asset.content_type
+        headers["Content-Length"] = str(variant.size)
+        if variant.encoding:
+            headers["Content-Encoding"] = variant.encoding
+        return 200, headers, variant
+
+
+class StaticRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves an AssetIndex with keep-alive and sendfile bodies"""
+
+    protocol_version = "HTTP/1.1"
+    index: AssetIndex = None
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body: bool):
+        status, headers, variant = self.index.resolve(
+            urllib.parse.unquote(self.path.split("?", 1)[0]),
+            self.headers.get("Accept-Encoding"), self.headers.get("If-None-Match"),
+        )
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not send_body:
+            return
+        if variant is None:
+            if status == 404:
+                self.wfile.write(b"Not Found")
+            return
+        self.wfile.flush()
+        with open(variant.path, "rb") as f:
+            self.connection.sendfile(f)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class StaticServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(index: AssetIndex, port: int = 8080, host: str = ""):
+    """Serve an AssetIndex until interrupted"""
+    handler = type("Handler", (StaticRequestHandler,), {"index": index})
+    with StaticServer((host, port), handler) as httpd:
+        logger.info(f"Serving {index.root} at port {port}")
+        httpd.serve_forever()
+
+
+class StaticAssetsApp:
+    """ASGI app serving an AssetIndex, for mounting into FastAPI"""
+
+    def __init__(self, index: AssetIndex):
+        self.index = index
+
+    async def __call__(self, scope, receive, send):
+        from starlette.responses import FileResponse, PlainTextResponse, Response
+
+        if scope["type"] != "http":
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+            await response(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        status, response_headers, variant = self.index.resolve(
+            scope["path"], headers.get("accept-encoding"), headers.get("if-none-match"),
+        )
+        if variant is None:
+            body = b"Not Found" if status == 404 else b""
+            response = Response(body, status_code=status, headers=response_headers)
+        else:
+            media_type = response_headers.pop("Content-Type")
+            if media_type.startswith("text/"):
+                # Starlette appends the charset to text types itself
+                media_type = media_type.split(";", 1)[0]
+            response_headers.pop("Content-Length")
+            response = FileResponse(variant.path, headers=response_headers, media_type=media_type,
+                                    method=scope["method"])
+        await response(scope, receive, send)
@@ -0,0 +1,229 @@
+# stub_ultravox.py
+"""
+Local stand-in for the UltraVox API.
+
+Accepts the request in any of the wire formats upstream_codec produces
+(JSON with base64 WAV/FLAC/Opus, or multipart with a binary audio part),
+decodes the audio and echoes it back as the reply, so round-trip fidelity
+and bytes on the wire can be checked without the real service.
+
+Latency and failures can be injected to load-test the service against a
+slow or flaky upstream (see bench_load.py):
+
+    python stub_ultravox.py serve --port 9000 --latency-ms 300 --per-audio-s-ms 50 --error-rate 0.02
+    python stub_ultravox.py verify clips/*.wav
+
+The same settings are read from STUB_* environment variables when the stub
+is run under uvicorn directly.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple, Optional
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from audio_processing import AudioProcessingError, normalize_audio, wav_to_float
+from ultravox_client import UltraVoxClient
+from upstream_codec import CODECS, TRANSPORTS, encode_for_upstream, json_payload, multipart_request
+
+app = FastAPI(title="UltraVox stub")
+
+
+class FaultSettings(NamedTuple):
+    # Fixed and random extra time before every reply
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    # Simulated model time per second of received audio
+    per_audio_s_ms: float = 0.0
+    # Fraction of requests answered with error_status (and Retry-After: 0)
+    error_rate: float = 0.0
+    error_status: int = 503
+    # Fraction of requests that stall for hang_s before replying
+    hang_rate: float = 0.0
+    hang_s: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> "FaultSettings":
+        return cls(**{
+            name: type(default)(os.environ[f"STUB_{name.upper()}"])
+            for name, default in cls._field_defaults.items()
+            if f"STUB_{name.upper()}" in os.environ
+        })
+
+
+faults = FaultSettings.from_env()
+counters = Counter()
+
+
+def extract_audio(body: bytes, form: Optional[dict] = None) -> tuple[bytes, str]:
+    """Pull the audio bytes and their MIME type out of a JSON or multipart request"""
+    if form is not None:
+        part = form.get("audio")
+        if part is None:
+            raise ValueError("multipart request has no audio part")
+        return part, form.get("audio_content_type") or "application/octet-stream"
+
+    payload = json.loads(body)
+    content = payload["messages"][0]["content"]
+    _, marker, audio_base64 = content.partition("audio_data: ")
+    if not marker:
+        raise ValueError("system message has no audio_data")
+    return base64.b64decode(audio_base64), payload.get("audio_format", "audio/wav")
+
+
+@app.get("/stats")
+async def stats():
+    return {"faults": faults._asdict(), **counters}
+
+
+@app.post("/{path:path}")
+async def reply(request: Request):
+    counters["requests"] += 1
+    if faults.hang_rate and random.random() < faults.hang_rate:
+        counters["hangs"] += 1
+        await asyncio.sleep(faults.hang_s)
+    if faults.error_rate and random.random() < faults.error_rate:
+        counters["injected_errors"] += 1
+        return JSONResponse(
+            {"error": "injected failure"}, status_code=faults.error_status, headers={"Retry-After": "0"}
+        )
+
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    form = None
+    if content_type.startswith("multipart/"):
+        parsed = await request.form()
+        upload = parsed.get("audio")
+        form = {}
+        if upload is not None:
+            form = {"audio": await upload.read(), "audio_content_type": upload.content_type}
+
+    try:
+        audio, mime_type = extract_audio(body, form)
+        wav, info = await asyncio.to_thread(normalize_audio, audio, mime_type)
+    except (ValueError, KeyError, IndexError, AudioProcessingError) as e:
+        counters["bad_requests"] += 1
+        raise HTTPException(status_code=400, detail=str(e))
+
+    delay_ms = faults.latency_ms + random.uniform(0, faults.jitter_ms) + faults.per_audio_s_ms * info["duration_ms"] / 1000
+    if delay_ms > 0:
+        await asyncio.sleep(delay_ms / 1000)
+    counters["replies"] += 1
+    counters["received_bytes"] += len(body)
+
+    return JSONResponse({
+        "audio": base64.b64encode(wav).decode("ascii"),
+        "received_bytes": len(body),
+        "audio_bytes": len(audio),
+        "audio_format": mime_type,
+        "duration_ms": info["duration_ms"],
+    })
+
+
+def snr_db(reference: np.ndarray, decoded: np.ndarray, max_lag: int = 480) -> float:
+    """
+    Signal-to-noise ratio of a decoded signal against the original, after
+    undoing any small codec delay found by cross-correlation
+    """
+    window = min(len(reference), len(decoded), 5 * 16000)
+    if window > 2 * max_lag:
+        correlation = np.correlate(decoded[:window], reference[max_lag:window - max_lag], "valid")
+        lag = int(correlation.argmax()) - max_lag
+        if lag > 0:
+            decoded = decoded[lag:]
+        elif lag < 0:
+            reference = reference[-lag:]
+    length = min(len(reference), len(decoded))
+    reference, decoded = reference[:length], decoded[:length]
+    noise = np.sum((reference - decoded) ** 2)
+    if noise == 0:
+        return float("inf")
+    return float(10 * np.log10(np.sum(reference ** 2) / noise + 1e-12))
+
+
+async def verify(url: str, paths: list, opus_bitrate: str):
+    client = UltraVoxClient(url, "stub", max_retries=0)
+    print(f"{'clip':<24} {'codec':<5} {'transport':<9} {'wire bytes':>10} {'ratio':>6} {'encode ms':>9} {'SNR dB':>7}")
+    try:
+        for path in paths:
+            with open(path, "rb") as f:
+                wav, _ = normalize_audio(f.read(), None)
+            reference = wav_to_float(wav)
+            baseline = None
+
+            for codec in CODECS:
+                audio = encode_for_upstream(wav, codec, opus_bitrate=opus_bitrate)
+                for transport in TRANSPORTS:
+                    if transport == "multipart":
+                        response = await client.post_multipart(**multipart_request(audio, "verify", "stub"))
+                    else:
+                        response = await client.post_json(json_payload(audio, "verify", "stub"))
+                    response.raise_for_status()
+                    data = response.json()
+
+                    echoed = wav_to_float(base64.b64decode(data["audio"]))
+                    baseline = baseline or data["received_bytes"]
+                    print(
+                        f"{path[-24:]:<24} {codec:<5} {transport:<9} {data['received_bytes']:>10} "
+                        f"{baseline / data['received_bytes']:>5.1f}x {audio.encode_ms:>9.1f} "
+                        f"{snr_db(reference, echoed):>7.1f}"
+                    )
+    finally:
+        await client.aclose()
+
+
+def serve_in_background(host: str, port: int):
+    """Run the stub in a daemon thread and return once it accepts connections"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main():
+    global faults
+    parser = argparse.ArgumentParser(description="Local UltraVox stub that echoes the audio it receives")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the stub server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=9000)
+    for name, default in FaultSettings._field_defaults.items():
+        serve_parser.add_argument(
+            f"--{name.replace('_', '-')}", type=type(default), default=getattr(faults, name),
+        )
+
+    verify_parser = commands.add_parser("verify", help="round-trip clips through every codec and transport")
+    verify_parser.add_argument("clips", nargs="+")
+    verify_parser.add_argument("--url", help="stub to use; by default one is started on --port")
+    verify_parser.add_argument("--port", type=int, default=9000)
+    verify_parser.add_argument("--opus-bitrate", default="32k")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        import uvicorn
+        faults = FaultSettings(**{name: getattr(args, name) for name in FaultSettings._fields})
+        uvicorn.run(app, host=args.host, port=args.port)
+        return
+
+    url = args.url
+    if url is None:
+        serve_in_background("127.0.0.1", args.port)
+        url = f"http://127.0.0.1:{args.port}/"
+    asyncio.run(verify(url, args.clips, args.opus_bitrate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from voice_loop import Endpointer, RingBuffer
+
+
+def test_ring_buffer_wraps():
+    ring = RingBuffer(10)
+    ring.write(np.arange(7, dtype=np.float32))
+    ring.write(np.arange(7, 14, dtype=np.float32))
+    assert ring.read(0, 14).tolist() == list(range(4, 14))
+    assert ring.read(5, 12).tolist() == list(range(5, 12))
+
+
+def test_ring_buffer_block_larger_than_capacity():
+    for offset in range(10):
+        ring = RingBuffer(10)
+        ring.write(np.zeros(offset, dtype=np.float32))
+        ring.write(np.arange(offset, offset + 25, dtype=np.float32))
+        assert ring.end == offset + 25
+        assert ring.read(0, ring.end).tolist() == list(range(offset + 15, offset + 25))
+
+
+def test_ring_buffer_block_equal_to_capacity():
+    ring = RingBuffer(10)
+    ring.write(np.zeros(3, dtype=np.float32))
+    ring.write(np.arange(3, 13, dtype=np.float32))
+    assert ring.read(3, 13).tolist() == list(range(3, 13))
+
+
+def test_endpointer_finds_utterance():
+    rate = 16000
+    endpointer = Endpointer(rate)
+    frame = endpointer.frame
+    # One second of quiet, one second of speech, then a second of quiet
+    energies = [-70.0] * 33 + [-20.0] * 33 + [-70.0] * 33
+    found = [bounds for i, db in enumerate(energies)
+             if (bounds := endpointer.feed(db, (i + 1) * frame)) is not None]
+    assert len(found) == 1
+    start, end = found[0]
+    assert start == 33 * frame - endpointer.preroll
+    assert end == 66 * frame + endpointer.preroll
@@ -1,21 +1,21 @@
-from transformers import pipeline, AutoProcessor, AutoModelForSpeechSeq2Seq
-import torch
+from audio_processing import TARGET_RATE, normalize_audio, wav_to_float
+from vad import split_segments, stitch_transcripts
+from whisper_registry import registry
 
-# Load Whisper model and processor
-device = "cuda:0" if torch.cuda.is_available() else "cpu"
-model_id = "openai/whisper-large-v3"
 
-model = AutoModelForSpeechSeq2Seq.from_pretrained(model_id, torch_dtype=torch.float16 if device == "cuda:0" else torch.float32).to(device)
-processor = AutoProcessor.from_pretrained(model_id)
+def transcribe_samples(samples):
+    """Transcribe 16kHz float samples already in memory"""
+    # Transcribe the speech segments as one batch and stitch them back together
+    segments = split_segments(samples, TARGET_RATE)
+    if not segments:
+        return ""
+    pipe = registry.get()
+    inputs = [{"raw": samples[s.start:s.end], "sampling_rate": TARGET_RATE} for s in segments]
+    results = pipe(inputs, batch_size=len(inputs))
+    return stitch_transcripts(segments, [result["text"] for result in results])
 
-pipe = pipeline(
-    "automatic-speech-recognition",
-    model=model,
-    tokenizer=processor.tokenizer,
-    feature_extractor=processor.feature_extractor,
-    device=device
-)
 
 def transcribe_audio(filename):
-    result = pipe(filename)
-    return result["text"]
+    with open(filename, "rb") as f:
+        wav, _ = normalize_audio(f.read(), None, trim_silence=True)
+    return transcribe_samples(wav_to_float(wav))
@@ -0,0 +1,211 @@
+# ultravox_client.py
+import asyncio
+import contextlib
+import json
+import logging
+import random
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Upstream status codes worth retrying
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# Strings longer than this are cut when payloads are logged (base64 audio)
+LOG_MAX_STRING = 200
+
+
+def redact_payload(value):
+    """Copy of a JSON-like value with long strings truncated, safe to log"""
+    if isinstance(value, str):
+        if len(value) <= LOG_MAX_STRING:
+            return value
+        return f"{value[:LOG_MAX_STRING]}... <{len(value) - LOG_MAX_STRING} more chars>"
+    if isinstance(value, dict):
+        return {key: redact_payload(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact_payload(item) for item in value]
+    return value
+
+
+def redact_error_body(body: bytes):
+    """An upstream error body (JSON or text) with long strings truncated"""
+    text = body.decode(errors="replace")
+    try:
+        return redact_payload(json.loads(text))
+    except ValueError:
+        return redact_payload(text)
+
+
+class UltraVoxClient:
+    """
+    Shared async HTTP client for the UltraVox API.
+
+    Keeps keep-alive connections in a pool, caps the number of concurrent
+    upstream calls and retries 429/5xx responses with jittered exponential
+    backoff. One instance is created at app startup and reused by every request.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        timeout: float = 30.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        max_concurrency: int = 64,
+        max_retries: int = 3,
+        backoff_base: float = 0.25,
+        backoff_max: float = 8.0,
+    ):
+        self.url = url
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._client = httpx.AsyncClient(
+            headers={"Authorization": f"Api-Key {api_key}"},
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # Counters exposed through stats()
+        self._in_flight = 0
+        self._waiting = 0
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+        self._total_latency = 0.0
+
+    async def post_json(self, payload: dict) -> httpx.Response:
+        """POST a JSON payload to UltraVox; see post()"""
+        return await self.post(json=payload)
+
+    async def post_multipart(self, data: dict, files: dict) -> httpx.Response:
+        """POST form fields and binary file parts to UltraVox; see post()"""
+        return await self.post(data=data, files=files)
+
+    async def post(self, **request) -> httpx.Response:
+        """
+        POST to UltraVox, retrying on 429/5xx and transport errors.
+        Keyword arguments are passed to httpx and must be replayable.
+        Returns the final response; non-retryable error statuses are returned as-is.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await self._send(request)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    self._failures += 1
+                    raise
+                logger.warning(f"UltraVox transport error (attempt {attempt + 1}): {e}")
+                delay = self._backoff(attempt, None)
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    if response.status_code != 200:
+                        self._failures += 1
+                    return response
+                logger.warning(
+                    f"UltraVox returned {response.status_code} (attempt {attempt + 1}), retrying"
+                )
+                delay = self._backoff(attempt, response.headers.get("Retry-After"))
+
+            attempt += 1
+            self._retries += 1
+            await asyncio.sleep(delay)
+
+    async def _send(self, request: dict) -> httpx.Response:
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._in_flight += 1
+        self._requests += 1
+        started = time.perf_counter()
+        try:
+            return await self._client.post(self.url, **request)
+        finally:
+            self._total_latency += time.perf_counter() - started
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    @contextlib.asynccontextmanager
+    async def stream_post(self, body: AsyncIterator[bytes]) -> AsyncIterator[httpx.Response]:
+        """
+        POST a streamed JSON body and yield the response before its body is read.
+
+        A streamed body cannot be replayed, so there are no retries; the
+        concurrency slot is held until the response has been consumed.
+        """
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._in_flight += 1
+        self._requests += 1
+        started = time.perf_counter()
+        try:
+            async with self._client.stream(
+                "POST",
+                self.url,
+                content=body,
+                headers={"Content-Type": "application/json"},
+            ) as response:
+                if response.status_code != 200:
+                    self._failures += 1
+                yield response
+        except httpx.HTTPError:
+            self._failures += 1
+            raise
+        finally:
+            self._total_latency += time.perf_counter() - started
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def stats(self) -> dict:
+        """Pool and request statistics"""
+        # httpx does not expose its connection pool publicly
+        pool = getattr(self._client._transport, "_pool", None)
+        connections = list(pool.connections) if pool is not None else []
+        idle = sum(1 for c in connections if c.is_idle())
+        return {
+            "max_connections": self.max_connections,
+            "max_concurrency": self.max_concurrency,
+            "open_connections": len(connections),
+            "idle_connections": idle,
+            "active_connections": len(connections) - idle,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "requests": self._requests,
+            "retries": self._retries,
+            "failures": self._failures,
+            "avg_latency_ms": round(1000 * self._total_latency / self._requests, 2) if self._requests else 0.0,
+        }
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -0,0 +1,131 @@
+# upstream_codec.py
+import base64
+import json
+import logging
+import subprocess
+import time
+from typing import NamedTuple
+
+from audio_processing import AudioProcessingError, parse_wav_header
+
+logger = logging.getLogger(__name__)
+
+# Codec name -> (MIME type, file extension, ffmpeg output arguments)
+CODECS = {
+    "wav": ("audio/wav", "wav", None),
+    "flac": ("audio/flac", "flac", ["-c:a", "flac", "-compression_level", "5", "-f", "flac"]),
+    # Complexity 5 halves encode time against the default 10 for the same size
+    "opus": ("audio/ogg", "ogg", ["-c:a", "libopus", "-application", "voip", "-compression_level", "5", "-f", "ogg"]),
+}
+
+# "auto" picks one of the codecs above from the clip duration
+CODEC_CHOICES = ("auto",) + tuple(CODECS)
+
+TRANSPORTS = ("json", "multipart")
+
+
+class EncodedAudio(NamedTuple):
+    data: bytes
+    codec: str
+    mime_type: str
+    filename: str
+    duration_s: float
+    encode_ms: float
+
+
+def choose_codec(codec: str, duration_s: float, flac_min_s: float = 1.0, opus_min_s: float = 20.0) -> str:
+    """
+    Resolve "auto" to a concrete codec for a clip of this length.
+
+    Very short clips go as WAV, where an encoder process costs more than the
+    bytes it saves; medium clips use lossless FLAC; long clips use Opus,
+    which is an order of magnitude smaller but lossy.
+    """
+    if codec != "auto":
+        if codec not in CODECS:
+            raise ValueError(f"Unknown upstream codec {codec}, expected one of {CODEC_CHOICES}")
+        return codec
+    if duration_s < flac_min_s:
+        return "wav"
+    if duration_s < opus_min_s:
+        return "flac"
+    return "opus"
+
+
+def wav_duration_s(wav_bytes: bytes) -> float:
+    """Duration of a WAV from its header alone"""
+    wav = parse_wav_header(wav_bytes)
+    return wav.data_size / (wav.sample_width * wav.channels * wav.frame_rate) if wav.frame_rate else 0.0
+
+
+def needs_encoder(codec: str) -> bool:
+    """Whether a concrete codec runs ffmpeg, as opposed to passing the WAV through"""
+    return CODECS[codec][2] is not None
+
+
+def encode_for_upstream(wav_bytes: bytes, codec: str = "wav", flac_min_s: float = 1.0,
+                        opus_min_s: float = 20.0, opus_bitrate: str = "32k") -> EncodedAudio:
+    """
+    Encode normalized 16kHz mono PCM16 WAV for the UltraVox request.
+
+    Blocking (runs ffmpeg for FLAC and Opus); runs inside the audio worker
+    pool, so it must stay a module-level function.
+    """
+    started = time.perf_counter()
+    duration_s = wav_duration_s(wav_bytes)
+    codec = choose_codec(codec, duration_s, flac_min_s, opus_min_s)
+    mime_type, extension, output_args = CODECS[codec]
+
+    if output_args is None:
+        data = wav_bytes
+    else:
+        if codec == "opus":
+            output_args = output_args + ["-b:a", opus_bitrate]
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "wav", "-i", "pipe:0"]
+        command += output_args + ["pipe:1"]
+        result = subprocess.run(command, input=wav_bytes, capture_output=True)
+        if result.returncode != 0:
+            raise AudioProcessingError(f"ffmpeg {codec} encode failed: {result.stderr.decode(errors='replace').strip()}")
+        data = result.stdout
+
+    encoded = EncodedAudio(
+        data, codec, mime_type, f"audio.{extension}", round(duration_s, 3),
+        round(1000 * (time.perf_counter() - started), 2),
+    )
+    logger.debug(
+        f"Encoded {duration_s:.1f}s as {codec}: {len(wav_bytes)} -> {len(data)} bytes in {encoded.encode_ms}ms"
+    )
+    return encoded
+
+
+def json_payload(audio: EncodedAudio, prompt: str, model: str) -> dict:
+    """
+    The original request shape: base64 audio embedded in the system message.
+    Non-WAV audio is flagged with an audio_format field.
+    """
+    audio_base64 = base64.b64encode(audio.data).decode("ascii")
+    payload = {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": f"content: {prompt}\naudio_data: {audio_base64}"
+            }
+        ]
+    }
+    if audio.codec != "wav":
+        payload["audio_format"] = audio.mime_type
+    return payload
+
+
+def multipart_request(audio: EncodedAudio, prompt: str, model: str) -> dict:
+    """
+    Binary transport: the messages travel as a small JSON form field and the
+    audio as a raw file part, with no base64 or JSON escaping of the audio.
+    Returns keyword arguments for UltraVoxClient.post_multipart().
+    """
+    payload = {"model": model, "messages": [{"role": "system", "content": f"content: {prompt}"}]}
+    return {
+        "data": {"payload": json.dumps(payload)},
+        "files": {"audio": (audio.filename, audio.data, audio.mime_type)},
+    }
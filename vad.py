@@ -0,0 +1,144 @@
+# vad.py
+import re
+from typing import NamedTuple
+
+import numpy as np
+
+# Analysis frame length
+FRAME_MS = 30
+
+# Frames this far above the estimated noise floor count as speech...
+MARGIN_DB = 10.0
+# ...unless they are below this absolute level...
+MIN_SPEECH_DB = -50.0
+# ...and anything within this range of the loudest frame always counts
+DYNAMIC_RANGE_DB = 20.0
+
+# Silence kept around speech, shortest gap that splits speech, shortest speech kept
+PADDING_MS = 200
+MIN_SILENCE_MS = 300
+MIN_SPEECH_MS = 100
+
+
+class SpeechSegment(NamedTuple):
+    start: int
+    end: int
+
+
+def frame_energy_db(samples: np.ndarray, frame: int) -> np.ndarray:
+    """Mean power of each full frame in dBFS"""
+    count = len(samples) // frame
+    frames = samples[:count * frame].reshape(count, frame)
+    power = np.einsum("ij,ij->i", frames, frames) / frame
+    return 10 * np.log10(power + 1e-12)
+
+
+def _runs(mask: np.ndarray) -> list:
+    """(start, end) frame index pairs of each run of True values"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def detect_speech(samples: np.ndarray, rate: int = 16000) -> list:
+    """
+    Energy-based voice activity detection.
+
+    The speech threshold adapts to the clip: it sits MARGIN_DB above the
+    noise floor (10th percentile frame energy), is never below MIN_SPEECH_DB,
+    and never more than DYNAMIC_RANGE_DB under the loudest frame. Detected
+    regions are padded, short gaps are bridged and blips are dropped.
+    Returns sample-index SpeechSegments in order.
+    """
+    frame = int(rate * FRAME_MS / 1000)
+    if len(samples) < frame:
+        return []
+
+    energy = frame_energy_db(np.asarray(samples, dtype=np.float32), frame)
+    peak = energy.max()
+    if peak < MIN_SPEECH_DB:
+        return []
+    threshold = min(max(np.percentile(energy, 10) + MARGIN_DB, MIN_SPEECH_DB), peak - DYNAMIC_RANGE_DB)
+    speech = energy > threshold
+
+    # Pad each region, which also bridges gaps up to twice the padding
+    pad = PADDING_MS // FRAME_MS
+    speech = np.convolve(speech.astype(np.float32), np.ones(2 * pad + 1), mode="same") > 0
+
+    # Bridge remaining short gaps
+    min_gap = MIN_SILENCE_MS // FRAME_MS
+    for start, end in _runs(~speech):
+        if 0 < start and end < len(speech) and end - start < min_gap:
+            speech[start:end] = True
+
+    min_run = MIN_SPEECH_MS // FRAME_MS + 2 * pad
+    return [
+        # Speech running into the last frame keeps the partial frame after it
+        SpeechSegment(int(start) * frame, len(samples) if end == len(speech) else int(end) * frame)
+        for start, end in _runs(speech)
+        if end - start >= min_run
+    ]
+
+
+def speech_bounds(samples: np.ndarray, rate: int = 16000) -> tuple:
+    """
+    Sample range from the start of the first to the end of the last speech
+    region. The whole clip is kept when no speech is found, so silence
+    trimming never turns a request into empty audio.
+    """
+    segments = detect_speech(samples, rate)
+    if not segments:
+        return 0, len(samples)
+    return segments[0].start, segments[-1].end
+
+
+def split_segments(samples: np.ndarray, rate: int = 16000,
+                   max_segment_s: float = 30.0, overlap_s: float = 1.0) -> list:
+    """
+    Split audio into speech segments no longer than max_segment_s.
+
+    Neighbouring speech regions are packed together while they fit and the
+    silence between packs is dropped. A single region longer than the limit
+    is cut into windows overlapping by overlap_s so no word is lost at a cut;
+    stitch_transcripts removes the duplicated words.
+    """
+    max_len = int(max_segment_s * rate)
+    step = max_len - int(overlap_s * rate)
+    if step <= 0:
+        raise ValueError(f"Segment overlap ({overlap_s}s) must be shorter than the maximum segment ({max_segment_s}s)")
+
+    segments = []
+    for region in detect_speech(samples, rate):
+        if segments and region.end - segments[-1].start <= max_len:
+            segments[-1] = SpeechSegment(segments[-1].start, region.end)
+            continue
+        start = region.start
+        while region.end - start > max_len:
+            segments.append(SpeechSegment(start, start + max_len))
+            start += step
+        segments.append(SpeechSegment(start, region.end))
+    return segments
+
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def stitch_transcripts(segments: list, texts: list, max_overlap_words: int = 20) -> str:
+    """
+    Join per-segment transcripts. Where a segment overlaps the previous one,
+    the longest run of leading words repeating the previous tail is dropped.
+    """
+    words = []
+    previous_end = None
+    for segment, text in zip(segments, texts):
+        current = text.split()
+        if previous_end is not None and segment.start < previous_end and words:
+            tail = [_normalize_word(w) for w in words[-max_overlap_words:]]
+            head = [_normalize_word(w) for w in current[:max_overlap_words]]
+            for size in range(min(len(tail), len(head)), 0, -1):
+                if tail[-size:] == head[:size]:
+                    current = current[size:]
+                    break
+        words.extend(current)
+        previous_end = segment.end
+    return " ".join(words)
@@ -0,0 +1,257 @@
+# voice_loop.py
+"""
+Continuous, pipelined voice assistant loop.
+
+Four threads hand audio and text to each other through queues, so each
+stage works on one utterance while the next stage works on the previous:
+
+    capture    sounddevice callback, copies each block into a queue
+    listener   writes blocks into a ring buffer and runs endpointing; a
+               finished utterance is cut out of the ring buffer as samples
+    asr        transcribes utterances with the warm Whisper pipeline
+    tts        one persistent pyttsx3 engine speaking the replies
+
+No audio touches the disk. Capture is muted while a reply is being spoken
+so the assistant does not hear itself.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from audio_processing import TARGET_RATE
+from vad import FRAME_MS, MARGIN_DB, MIN_SPEECH_DB, frame_energy_db
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """The most recent `capacity` samples, addressed by absolute sample position"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.end = 0
+        self._data = np.zeros(capacity, dtype=np.float32)
+
+    def write(self, samples: np.ndarray):
+        count = len(samples)
+        if count >= self.capacity:
+            samples = samples[-self.capacity:]
+        # Position of the first sample kept, which is past self.end when older ones were dropped
+        index = (self.end + count - len(samples)) % self.capacity
+        first = min(len(samples), self.capacity - index)
+        self._data[index:index + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self.end += count
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Copy of samples [start, end); anything already overwritten is skipped"""
+        start = max(start, self.end - self.capacity, 0)
+        end = min(end, self.end)
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+        first, last = start % self.capacity, end % self.capacity
+        if first < last or last == 0:
+            return self._data[first:last or self.capacity].copy()
+        return np.concatenate((self._data[first:], self._data[:last]))
+
+
+class Endpointer:
+    """
+    Streaming utterance detection on fixed-size frames.
+
+    The noise floor follows the quietest recent frames: it drops to a
+    quieter frame at once and creeps up slowly while nobody is talking.
+    Speech starts after start_ms of frames above the threshold and ends
+    after end_silence_ms below it, or when the utterance reaches
+    max_utterance_s. feed() returns the utterance's (start, end) sample
+    positions, including preroll_ms of lead-in, when one ends.
+    """
+
+    def __init__(self, rate: int = TARGET_RATE, start_ms: int = 90, end_silence_ms: int = 600,
+                 preroll_ms: int = 300, min_speech_ms: int = 250, max_utterance_s: float = 30.0,
+                 floor_rise_db_per_s: float = 1.0):
+        self.frame = int(rate * FRAME_MS / 1000)
+        self.start_frames = max(1, start_ms // FRAME_MS)
+        self.end_frames = max(1, end_silence_ms // FRAME_MS)
+        self.preroll = int(rate * preroll_ms / 1000)
+        self.min_speech = int(rate * min_speech_ms / 1000)
+        self.max_utterance = int(rate * max_utterance_s)
+        self.floor_rise = floor_rise_db_per_s * FRAME_MS / 1000
+
+        self.floor: Optional[float] = None
+        self.reset()
+
+    def reset(self):
+        self.in_speech = False
+        self._loud_run = 0
+        self._quiet_run = 0
+        self._start = 0
+        self._last_speech_end = 0
+
+    def feed(self, energy_db: float, position: int) -> Optional[tuple]:
+        """Process one frame ending at sample `position`"""
+        if self.floor is None or energy_db < self.floor:
+            self.floor = energy_db
+        elif not self.in_speech:
+            self.floor += self.floor_rise
+
+        loud = energy_db > max(self.floor + MARGIN_DB, MIN_SPEECH_DB)
+        if not self.in_speech:
+            self._loud_run = self._loud_run + 1 if loud else 0
+            if self._loud_run >= self.start_frames:
+                self.in_speech = True
+                self._start = position - self._loud_run * self.frame
+                self._last_speech_end = position
+                self._quiet_run = 0
+            return None
+
+        if loud:
+            self._quiet_run = 0
+            self._last_speech_end = position
+        else:
+            self._quiet_run += 1
+
+        if self._quiet_run >= self.end_frames or position - self._start >= self.max_utterance:
+            start, end = self._start, self._last_speech_end
+            self.reset()
+            if end - start >= self.min_speech:
+                # Keep a little audio either side so word edges are not clipped
+                return max(0, start - self.preroll), min(position, end + self.preroll)
+        return None
+
+
+class VoiceLoop:
+    """
+    Runs capture, endpointing, transcription and speech concurrently.
+
+    transcribe takes 16kHz float samples and returns text; respond turns a
+    transcription into the reply to speak (or None to stay quiet); speaker
+    is a response.Speaker.
+    """
+
+    def __init__(self, transcribe: Callable[[np.ndarray], str], respond: Callable[[str], Optional[str]],
+                 speaker, rate: int = TARGET_RATE, endpointer: Optional[Endpointer] = None,
+                 mute_while_speaking: bool = True):
+        self.transcribe = transcribe
+        self.respond = respond
+        self.speaker = speaker
+        self.rate = rate
+        self.endpointer = endpointer or Endpointer(rate)
+        self.mute_while_speaking = mute_while_speaking
+
+        self.ring = RingBuffer(self.endpointer.max_utterance + 2 * self.endpointer.preroll)
+        self.blocks = queue.Queue()
+        self.utterances = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _capture_callback(self, indata, frames, time_info, status):
+        # Runs on the audio driver's thread: copy the block out and return at once
+        if status:
+            logger.warning(f"Audio input: {status}")
+        self.blocks.put(indata[:, 0].copy())
+
+    def feed(self, block: np.ndarray):
+        """Queue captured samples, as the capture callback does"""
+        self.blocks.put(np.asarray(block, dtype=np.float32))
+
+    def _listen(self):
+        frame = self.endpointer.frame
+        leftover = np.zeros(0, dtype=np.float32)
+        while not self._stop.is_set():
+            try:
+                block = self.blocks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if self.mute_while_speaking and self.speaker.speaking.is_set():
+                # Drop our own voice and start fresh afterwards
+                self.endpointer.reset()
+                leftover = leftover[:0]
+                continue
+
+            self.ring.write(block)
+            samples = np.concatenate((leftover, block)) if len(leftover) else block
+            count = len(samples) // frame
+            energies = frame_energy_db(samples, frame)
+            first_frame_end = self.ring.end - len(samples) + frame
+            for i in range(count):
+                bounds = self.endpointer.feed(float(energies[i]), first_frame_end + i * frame)
+                if bounds is not None:
+                    self.utterances.put((self.ring.read(*bounds), time.perf_counter()))
+            leftover = samples[count * frame:]
+
+    def _recognize(self):
+        while not self._stop.is_set():
+            try:
+                samples, endpointed_at = self.utterances.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            started = time.perf_counter()
+            try:
+                text = self.transcribe(samples).strip()
+            except Exception as e:
+                logger.error(f"Transcription failed: {str(e)}", exc_info=True)
+                continue
+            asr_ms = 1000 * (time.perf_counter() - started)
+            logger.info(f"Heard ({len(samples) / self.rate:.1f}s, ASR {asr_ms:.0f} ms): {text}")
+            if not text:
+                continue
+
+            reply = self.respond(text)
+            if reply:
+                def report_turnaround(endpointed_at=endpointed_at, asr_ms=asr_ms):
+                    turnaround = 1000 * (time.perf_counter() - endpointed_at)
+                    logger.info(f"Reply starts {turnaround:.0f} ms after end of speech (ASR {asr_ms:.0f} ms)")
+
+                self.speaker.speak(reply, on_start=report_turnaround)
+
+    def start(self):
+        for target, name in ((self._listen, "listener"), (self._recognize, "asr")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def run(self):
+        """Capture from the default microphone until interrupted"""
+        import sounddevice as sd
+
+        self.start()
+        stream = sd.InputStream(
+            samplerate=self.rate, channels=1, dtype="float32",
+            blocksize=self.endpointer.frame, callback=self._capture_callback,
+        )
+        try:
+            with stream:
+                print("Listening... (Ctrl+C to stop)")
+                while True:
+                    time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+def run_voice_loop(respond: Callable[[str], Optional[str]] = None):
+    """Continuous assistant with the shared Whisper model and a persistent TTS engine"""
+    from response import Speaker
+    from transcribe_input import transcribe_samples
+    from whisper_registry import registry
+
+    # Load the model before listening so the first reply is not delayed by it
+    registry.warm_up()
+    speaker = Speaker()
+    loop = VoiceLoop(transcribe_samples, respond or (lambda text: f"You said: {text}"), speaker)
+    try:
+        loop.run()
+    finally:
+        speaker.close()
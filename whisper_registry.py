@@ -0,0 +1,178 @@
+# whisper_registry.py
+import logging
+import os
+import resource
+import threading
+import time
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the command-line scripts; the service passes its own settings
+DEFAULT_MODEL_ID = os.getenv("WHISPER_MODEL_ID", "openai/whisper-large-v3")
+DEFAULT_DTYPE = os.getenv("WHISPER_DTYPE")
+DEFAULT_NUM_THREADS = int(os.getenv("WHISPER_NUM_THREADS", 0)) or None
+
+# Short names for the published checkpoints, smallest first
+CHECKPOINTS = {
+    "tiny": "openai/whisper-tiny",
+    "base": "openai/whisper-base",
+    "small": "openai/whisper-small",
+    "distil-small": "distil-whisper/distil-small.en",
+    "medium": "openai/whisper-medium",
+    "distil-large-v3": "distil-whisper/distil-large-v3",
+    "large-v3-turbo": "openai/whisper-large-v3-turbo",
+    "large-v3": "openai/whisper-large-v3",
+}
+
+# Inference modes: float weights, or int8 dynamic quantization of the
+# linear layers (CPU only; activations are quantized on the fly)
+DTYPES = ("float32", "float16", "int8")
+
+
+class ModelKey(NamedTuple):
+    model_id: str
+    device: str
+    dtype: str
+
+
+def default_device() -> str:
+    import torch
+    return "cuda:0" if torch.cuda.is_available() else "cpu"
+
+
+def default_dtype(device: str) -> str:
+    return "float16" if device.startswith("cuda") else "float32"
+
+
+def set_num_threads(num_threads: Optional[int]):
+    """Set the intra-op thread count torch uses for CPU inference"""
+    if num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+        logger.info(f"torch using {num_threads} threads")
+
+
+def model_bytes(model) -> int:
+    """Memory held by a model's weights, including int8 packed parameters"""
+    import torch
+
+    def tensor_bytes(value) -> int:
+        if isinstance(value, torch.Tensor):
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(tensor_bytes(v) for v in value)
+        return 0
+
+    return sum(tensor_bytes(v) for v in model.state_dict().values())
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of Whisper ASR pipelines.
+
+    Each (model_id, device, dtype) combination is loaded once, on first use
+    or through warm_up(), and kept in memory. Load time and memory cost are
+    recorded per model. Safe to call from multiple threads; concurrent
+    requests for a model that is still loading wait for that single load.
+    """
+
+    def __init__(self, num_threads: Optional[int] = DEFAULT_NUM_THREADS):
+        self.num_threads = num_threads
+        self._pipelines = {}
+        self._reports = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, model_id: Optional[str] = None, device: Optional[str] = None,
+                dtype: Optional[str] = None) -> ModelKey:
+        """Fill in defaults for any unspecified part of the key"""
+        model_id = model_id or DEFAULT_MODEL_ID
+        device = device or default_device()
+        dtype = dtype or DEFAULT_DTYPE or default_dtype(device)
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown Whisper dtype {dtype}, expected one of {DTYPES}")
+        if dtype == "int8" and device != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+        return ModelKey(CHECKPOINTS.get(model_id, model_id), device, dtype)
+
+    def get(self, model_id: Optional[str] = None, device: Optional[str] = None, dtype: Optional[str] = None):
+        """Return the warm ASR pipeline for this combination, loading it if needed"""
+        key = self.resolve(model_id, device, dtype)
+        pipe = self._pipelines.get(key)
+        if pipe is not None:
+            return pipe
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            pipe = self._pipelines.get(key)
+            if pipe is None:
+                pipe = self._load(key)
+                self._pipelines[key] = pipe
+        return pipe
+
+    def warm_up(self, model_id: Optional[str] = None, device: Optional[str] = None,
+                dtype: Optional[str] = None) -> dict:
+        """Load a model ahead of the first request and return its load report"""
+        key = self.resolve(model_id, device, dtype)
+        self.get(*key)
+        return self._reports[key]
+
+    def _load(self, key: ModelKey):
+        import torch
+        from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+
+        logger.info(f"Loading Whisper model {key.model_id} on {key.device} ({key.dtype})")
+        set_num_threads(self.num_threads)
+        rss_before = current_rss()
+        started = time.perf_counter()
+
+        quantize = key.dtype == "int8"
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(
+            key.model_id,
+            torch_dtype=torch.float32 if quantize else getattr(torch, key.dtype),
+        ).to(key.device)
+        model.eval()
+
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        processor = AutoProcessor.from_pretrained(key.model_id)
+
+        pipe = pipeline(
+            "automatic-speech-recognition",
+            model=model,
+            tokenizer=processor.tokenizer,
+            feature_extractor=processor.feature_extractor,
+            device=key.device,
+        )
+
+        load_seconds = time.perf_counter() - started
+        self._reports[key] = {
+            **key._asdict(),
+            "load_seconds": round(load_seconds, 2),
+            "parameter_bytes": model_bytes(model),
+            "rss_delta_bytes": current_rss() - rss_before,
+        }
+        logger.info(f"Loaded Whisper model: {self._reports[key]}")
+        return pipe
+
+    def stats(self) -> list:
+        """Load reports for every model currently held"""
+        return list(self._reports.values())
+
+
+# Shared by the service and the command-line scripts
+registry = ModelRegistry()